@@ -5,23 +5,61 @@ LaOpen 主应用文件
 像素风格的网站项目，具有完整的网球管理系统
 """
 
-from flask import Flask
+from flask import Flask, request
 from flask_login import LoginManager
 import os
+import time
 
 # 导入自定义模块
 from models import db, init_db
+from db_config import configure_database, register_sqlite_pragmas
+from read_replica import init_read_replica
+from metrics import init_metrics
+from query_budget import init_query_budget
+import versioning  # noqa: F401  注册变更版本号的 flush 钩子
+from fragment_cache import init_fragment_cache
+from assets import init_assets
+from template_cache import init_template_cache
+from identity_cache import init_identity_cache
+from passwords import init_passwords
+from rate_limit import init_login_limiter
+from live_updates import init_live_updates
+from fast_json import init_fast_json
 from auth import auth_bp, init_auth
 from main import main_bp
 
+class StartupTimer:
+    """按阶段记录启动耗时，冷启动/worker 重启变慢时便于定位"""
+    
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.phases = []
+    
+    def mark(self, name):
+        """记录从上一个标记到现在的耗时"""
+        now = time.perf_counter()
+        self.phases.append((name, (now - self._last) * 1000))
+        self._last = now
+    
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+    
+    def summary(self):
+        return '，'.join(f'{name} {elapsed:.1f}ms' for name, elapsed in self.phases)
+
 def create_app():
     """应用工厂函数"""
+    timer = StartupTimer()
     app = Flask(__name__)
     
     # 应用配置
     # 生产环境从环境变量读取，开发环境使用默认值
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'laopen-secret-key-2024')
     
+    # 密码哈希工作因子校准
+    init_passwords(app)
+    timer.mark('bcrypt校准')
+    
     # 数据库配置
     basedir = os.path.abspath(os.path.dirname(__file__))
     database_url = os.environ.get('DATABASE_URL')
@@ -36,13 +74,39 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SQLALCHEMY_ECHO'] = os.environ.get('FLASK_ENV') != 'production'
     
+    # 连接池 / SQLite PRAGMA 调优 (以及可选的只读副本 DATABASE_READ_URL)
+    configure_database(app)
+    
     # 初始化数据库
     db.init_app(app)
+    register_sqlite_pragmas(app, db)
+    init_read_replica(app, db)
+    timer.mark('数据库配置')
+    
+    # JSON 接口序列化 (可选 orjson)
+    init_fast_json(app)
+    
+    # 性能监控 (/metrics)
+    init_metrics(app, db)
+    
+    # 开发/测试环境的 SQL 查询预算和 N+1 检测
+    init_query_budget(app, db)
+    
+    # 页面片段缓存
+    init_fragment_cache(app)
+    timer.mark('监控/缓存')
+    
+    # 带哈希和预压缩的静态资源
+    init_assets(app)
+    timer.mark('静态资源')
     
     # 初始化登录管理器
     login_manager = LoginManager()
     login_manager.init_app(app)
     init_auth(login_manager)
+    init_identity_cache(app)
+    init_login_limiter(app)
+    timer.mark('登录')
     
     # 注册蓝图
     from tennis import tennis_bp
@@ -52,14 +116,43 @@ def create_app():
     app.register_blueprint(tennis_bp)
     app.register_blueprint(match_mgmt_bp)
     
+    # 赛事实时推送 (SSE)
+    init_live_updates(app)
+    timer.mark('蓝图注册')
+    
+    # 模板字节码缓存和预热
+    init_template_cache(app)
+    timer.mark('模板预热')
+    
+    print(f"⏱️  应用创建耗时：{timer.total_ms():.1f}ms ({timer.summary()})")
+    _log_first_request(app)
+    
     return app
 
+def _log_first_request(app):
+    """记录本进程第一个请求的耗时 (冷启动延迟)"""
+    state = {'logged': False}
+    
+    @app.before_request
+    def _first_request_started():
+        if not state['logged']:
+            request.environ['laopen.first_request_start'] = time.perf_counter()
+    
+    @app.after_request
+    def _first_request_finished(response):
+        start = request.environ.get('laopen.first_request_start')
+        if start is not None and not state['logged']:
+            state['logged'] = True
+            print(f"⏱️  进程 {os.getpid()} 首个请求 {request.path} 耗时：{(time.perf_counter() - start) * 1000:.1f}ms")
+        return response
+
 def init_directories():
-    """创建必要的目录"""
+    """创建缺失的目录 (已存在的直接跳过)"""
     directories = ['templates', 'static/css', 'static/js', 'instance']
     for directory in directories:
-        os.makedirs(directory, exist_ok=True)
-        print("✅ 目录创建成功：" + directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+            print("✅ 目录创建成功：" + directory)
 
 if __name__ == '__main__':
     # 创建必要的目录
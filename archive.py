@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 赛事归档
+已结束/已取消且结束时间早于截止日期的赛事，把它们的比赛从 games 移到 games_archive，
+赛事行和参与者保留在原表 (列表、日历和战绩统计仍然只查热表的小索引)：
+
+    python3 archive.py --older-than-days 180          # 归档半年前结束的赛事
+    python3 archive.py --older-than-days 180 --dry-run
+    python3 archive.py --restore 42                   # 需要修改比分时先恢复到热表
+
+- 每批赛事在一个事务中完成 复制 → 删除 → 标记 archived_at，中断后重新执行即可继续
+- 归档后赛事页面、导出、日历订阅、增量同步和两两统计重建都会读取归档表；
+  归档比赛是只读的，比分接口找不到它们 (先 --restore)
+- 选手积分/战绩和两两统计是汇总数据，归档不影响
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from models import db, Match, Game, ArchivedGame
+from versioning import touch_matches
+
+ARCHIVE_STATUSES = ('finished', 'cancelled')
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+
+# 每个事务归档的赛事数
+ARCHIVE_BATCH_SIZE = 100
+
+
+def _archive_columns():
+    """两张表共有的列 (归档表去掉了 actual_start_time、created_at)"""
+    return [column.name for column in ArchivedGame.__table__.columns]
+
+
+def _archivable(cutoff):
+    """可以归档的赛事：状态为已结束/已取消，结束 (或开始) 时间早于 cutoff，尚未归档"""
+    return select(Match.id).where(
+        Match.status.in_(ARCHIVE_STATUSES), Match.archived_at.is_(None),
+        func.coalesce(Match.end_datetime, Match.start_datetime) < cutoff)
+
+
+def archivable_match_ids(cutoff, limit=None):
+    query = _archivable(cutoff).order_by(Match.id)
+    if limit:
+        query = query.limit(limit)
+    return db.session.execute(query).scalars().all()
+
+
+def archive_preview(cutoff):
+    """将被归档的 (赛事数, 比赛数)"""
+    return (
+        db.session.execute(select(func.count()).select_from(_archivable(cutoff).subquery())).scalar(),
+        db.session.execute(select(func.count()).select_from(Game)
+                           .where(Game.match_id.in_(_archivable(cutoff)))).scalar(),
+    )
+
+
+def _move_games(conn, source, target, match_ids, columns):
+    """在同一事务中把这些赛事的比赛从 source 表复制到 target 表并删除原行，返回行数"""
+    conn.execute(target.insert().from_select(
+        columns, select(*[source.c[name] for name in columns]).where(source.c.match_id.in_(match_ids))))
+    return conn.execute(source.delete().where(source.c.match_id.in_(match_ids))).rowcount
+
+
+def archive_matches(cutoff, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """归档 cutoff 之前结束的赛事，返回 {'matches': n, 'games': n}"""
+    columns = _archive_columns()
+    matches_table = Match.__table__
+    counts = {'matches': 0, 'games': 0}
+
+    while True:
+        match_ids = archivable_match_ids(cutoff, batch_size)
+        db.session.rollback()
+        if not match_ids:
+            break
+        with db.engine.begin() as conn:
+            counts['games'] += _move_games(conn, Game.__table__, ArchivedGame.__table__, match_ids, columns)
+            conn.execute(matches_table.update().where(matches_table.c.id.in_(match_ids))
+                         .values(archived_at=datetime.utcnow()))
+            # 页面片段缓存和增量同步按赛事版本号失效
+            touch_matches(conn, match_ids)
+        counts['matches'] += len(match_ids)
+        if progress:
+            progress(counts)
+    return counts
+
+
+def restore_match(match_id):
+    """把一个已归档赛事的比赛移回热表 (需要修改比分时)，返回移回的场数"""
+    match = db.session.get(Match, match_id)
+    if match is None:
+        raise ValueError(f'赛事 #{match_id} 不存在')
+    if match.archived_at is None:
+        raise ValueError(f'赛事 #{match_id} 未归档')
+    db.session.rollback()
+
+    # 归档表中没有的列 (actual_start_time、created_at) 恢复后为空
+    columns = _archive_columns()
+    with db.engine.begin() as conn:
+        restored = _move_games(conn, ArchivedGame.__table__, Game.__table__, [match_id], columns)
+        table = Match.__table__
+        conn.execute(table.update().where(table.c.id == match_id).values(archived_at=None))
+        touch_matches(conn, [match_id])
+    return restored
+
+
+def _vacuum():
+    """SQLite 删除行后不会缩小文件，需要 VACUUM 回收空间"""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql('VACUUM')
+    return True
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+    from app import create_app
+    from models import init_db
+
+    parser = argparse.ArgumentParser(description='LaOpen 赛事归档')
+    parser.add_argument('--older-than-days', type=int, default=DEFAULT_ARCHIVE_AFTER_DAYS,
+                        help='归档结束时间早于多少天前的赛事')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不归档')
+    parser.add_argument('--vacuum', action='store_true', help='归档后执行 VACUUM 回收空间 (SQLite，会锁库)')
+    parser.add_argument('--restore', type=int, metavar='MATCH_ID', help='把该赛事的比赛移回热表')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if not init_db(app):
+            sys.exit(1)
+        started = time.perf_counter()
+
+        if args.restore:
+            try:
+                restored = restore_match(args.restore)
+            except ValueError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+            print(f"✅ 赛事 #{args.restore} 的 {restored} 场比赛已移回热表")
+            sys.exit(0)
+
+        cutoff = datetime.utcnow() - timedelta(days=args.older_than_days)
+        if args.dry_run:
+            matches, games = archive_preview(cutoff)
+            print(f"📦 {cutoff:%Y-%m-%d} 之前结束的赛事 {matches} 个，比赛 {games} 场 (未归档)")
+            sys.exit(0)
+
+        print(f"📦 归档 {cutoff:%Y-%m-%d} 之前结束的赛事 ...")
+        counts = archive_matches(cutoff, args.batch_size,
+                                 lambda counts: print(f"  … 赛事 {counts['matches']}，比赛 {counts['games']}"))
+        print(f"✅ 已归档赛事 {counts['matches']} 个，比赛 {counts['games']} 场，"
+              f"耗时 {time.perf_counter() - started:.1f}s")
+        if args.vacuum and counts['matches']:
+            if _vacuum():
+                print("🧹 VACUUM 完成")
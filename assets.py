@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 静态资源构建与分发
+为 static/css 和 static/js 下的文件生成带内容哈希的副本及 gzip/brotli 预压缩版本，
+模板中通过 asset_url('css/style.css') 引用，响应带一年期的 immutable 缓存头
+
+构建可以在部署时执行 (python3 assets.py build)，也会在应用启动时自动完成
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+from flask import Blueprint, current_app, request, send_from_directory, url_for, abort
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，缺少时只生成 gzip 版本
+    brotli = None
+
+# 需要处理的资源子目录 (相对于 static/)
+ASSET_DIRS = ('css', 'js')
+
+# 构建输出目录 (相对于 static/)，已加入 .gitignore
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# 小于该大小的文件不值得压缩
+MIN_COMPRESS_SIZE = 512
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+assets_bp = Blueprint('assets', __name__, url_prefix='/assets')
+
+
+def _hashed_name(relative_path, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    root, ext = os.path.splitext(relative_path)
+    return f'{root}.{digest}{ext}'
+
+
+def _atomic_write(path, data):
+    """先写到同目录下唯一的临时文件再改名：多个进程同时构建时互不干扰，也不会读到半个文件"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.',
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_if_missing(path, produce):
+    """
+    文件名包含内容哈希，已存在即说明内容相同，无需重写
+    produce 为返回内容的函数，只在需要写入时才调用 (压缩很慢，启动时不应重复压缩)
+    """
+    if os.path.exists(path):
+        return False
+    _atomic_write(path, produce())
+    return True
+
+
+def build_assets(static_folder):
+    """生成带哈希的资源和预压缩版本，返回 {原始路径: 哈希路径} 清单"""
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+
+    for asset_dir in ASSET_DIRS:
+        source_dir = os.path.join(static_folder, asset_dir)
+        if not os.path.isdir(source_dir):
+            continue
+        for dirpath, _, filenames in os.walk(source_dir):
+            for filename in sorted(filenames):
+                source_path = os.path.join(dirpath, filename)
+                relative_path = os.path.relpath(source_path, static_folder).replace(os.sep, '/')
+                with open(source_path, 'rb') as f:
+                    content = f.read()
+
+                hashed = _hashed_name(relative_path, content)
+                target_path = os.path.join(dist_folder, hashed)
+                _write_if_missing(target_path, lambda: content)
+
+                if len(content) >= MIN_COMPRESS_SIZE:
+                    _write_if_missing(target_path + '.gz',
+                                      lambda: gzip.compress(content, compresslevel=9, mtime=0))
+                    if brotli is not None:
+                        _write_if_missing(target_path + '.br', lambda: brotli.compress(content, quality=11))
+
+                manifest[relative_path] = hashed
+
+    # 清单未变化时不重写
+    if load_manifest(static_folder) != manifest:
+        _atomic_write(os.path.join(dist_folder, MANIFEST_NAME),
+                      json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest(static_folder):
+    manifest_path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(filename):
+    """模板辅助函数：返回带哈希的资源URL，未构建时回退到普通的 /static 地址"""
+    hashed = current_app.extensions.get('laopen_assets', {}).get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.serve_asset', filename=hashed)
+
+
+def _accepted_encodings():
+    accept = request.accept_encodings
+    encodings = []
+    if brotli is not None and accept['br']:
+        encodings.append(('br', '.br'))
+    if accept['gzip']:
+        encodings.append(('gzip', '.gz'))
+    return encodings
+
+
+@assets_bp.route('/<path:filename>')
+def serve_asset(filename):
+    """分发带哈希的资源，按 Accept-Encoding 优先返回预压缩版本"""
+    if filename not in current_app.extensions.get('laopen_assets_files', ()):
+        abort(404)
+
+    dist_folder = os.path.join(current_app.static_folder, DIST_DIR)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    served_name, content_encoding = filename, None
+    for encoding, suffix in _accepted_encodings():
+        if os.path.exists(os.path.join(dist_folder, filename + suffix)):
+            served_name, content_encoding = filename + suffix, encoding
+            break
+
+    response = send_from_directory(dist_folder, served_name, mimetype=mimetype, max_age=31536000,
+                                   conditional=True, etag=True)
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def init_assets(app):
+    """启动时构建资源 (ASSETS_BUILD_ON_STARTUP=0 时只读取已有清单) 并注册模板函数"""
+    app.config.setdefault('ASSETS_BUILD_ON_STARTUP', os.environ.get('ASSETS_BUILD_ON_STARTUP', '1') == '1')
+
+    if app.config['ASSETS_BUILD_ON_STARTUP']:
+        try:
+            manifest = build_assets(app.static_folder)
+        except OSError as e:
+            app.logger.warning('静态资源构建失败，使用未压缩的 /static 地址: %s', e)
+            manifest = load_manifest(app.static_folder)
+    else:
+        manifest = load_manifest(app.static_folder)
+
+    app.extensions['laopen_assets'] = manifest
+    app.extensions['laopen_assets_files'] = frozenset(manifest.values())
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.register_blueprint(assets_bp)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        print("用法: python3 assets.py build")
+        sys.exit(1)
+
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    print("📦 正在构建静态资源...")
+    for source, hashed in sorted(build_assets(static_folder).items()):
+        print(f"  ✅ {source} -> {DIST_DIR}/{hashed}")
+    if brotli is None:
+        print("  💡 未安装 brotli，仅生成 gzip 版本")
@@ -5,10 +5,14 @@ LaOpen 认证模块
 处理用户注册、登录、登出等认证相关功能
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
+import math
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db, User
 from forms import RegistrationForm, LoginForm
+from identity_cache import load_user_cached
+from passwords import HashingBusyError
+from rate_limit import client_ip
 
 # 创建认证蓝图
 auth_bp = Blueprint('auth', __name__)
@@ -41,6 +45,10 @@ def register():
             db.session.commit()
             flash('Registration successful! Please login', 'success')
             return redirect(url_for('auth.login'))
+        except HashingBusyError:
+            db.session.rollback()
+            flash('Server is busy, please try again in a moment', 'error')
+            return render_template('register.html', form=form), 503
         except Exception as e:
             db.session.rollback()
             flash('Registration failed, please try again', 'error')
@@ -53,8 +61,33 @@ def login():
     """用户登录"""
     form = LoginForm()
     if form.validate_on_submit():
+        # 限流检查在查询用户和 bcrypt 校验之前，被拒绝时只返回纯文本429
+        limiter = current_app.extensions.get('login_limiter')
+        if limiter is not None:
+            ip = client_ip(request, current_app.config['LOGIN_TRUSTED_PROXIES'])
+            retry_after = limiter.check(form.phone.data, ip)
+            if retry_after is not None:
+                return ('Too many login attempts, please try again later\n', 429,
+                        {'Retry-After': str(max(1, math.ceil(retry_after))),
+                         'Content-Type': 'text/plain; charset=utf-8'})
+        
         user = User.query.filter_by(phone=form.phone.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            password_ok = user is not None and user.check_password(form.password.data)
+        except HashingBusyError:
+            flash('Server is busy, please try again in a moment', 'error')
+            return render_template('login.html', form=form), 503
+        
+        if password_ok:
+            # 工作因子调整后，登录成功时顺便按新因子重新哈希
+            if user.password_needs_rehash:
+                try:
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"密码重新哈希失败：{e}")
+            
             login_user(user)
             flash(f'Welcome back, {user.nickname}!', 'success')
             
@@ -77,6 +110,38 @@ def logout():
     flash(f'Goodbye, {username}! Successfully logged out', 'info')
     return redirect(url_for('main.index'))
 
+@auth_bp.route('/admin/roster', methods=['POST'])
+@login_required
+def import_roster_api():
+    """
+    管理员批量导入球员名单
+    请求: multipart 文件字段 roster，或直接以 CSV/JSON 作为请求体
+    参数: match_id (可选，同时加入该赛事)、default_password、dry_run=1
+    """
+    from roster_import import parse_roster, import_roster, RosterError
+    
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin only'}), 403
+    
+    upload = request.files.get('roster')
+    if upload is not None:
+        content, filename = upload.read(), upload.filename
+    else:
+        content, filename = request.get_data(), '.json' if request.is_json else None
+    
+    try:
+        players = parse_roster(content, filename)
+        result = import_roster(players,
+                               match_id=request.values.get('match_id', type=int),
+                               default_password=request.values.get('default_password'),
+                               dry_run=request.values.get('dry_run') == '1')
+    except RosterError as e:
+        return jsonify({'error': e.message, 'errors': e.errors}), e.status_code
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Roster must be UTF-8 encoded'}), 400
+    
+    return jsonify(result), 200 if result['dry_run'] else 201
+
 def init_auth(login_manager):
     """初始化登录管理器"""
     login_manager.login_view = 'auth.login'
@@ -85,4 +150,5 @@ def init_auth(login_manager):
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # 短TTL进程内缓存 + 请求内去重 (见 identity_cache.py)
+        return load_user_cached(user_id)
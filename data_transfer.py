@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 数据导出/导入 (NDJSON)
+用于备份，以及从 instance/laopen.db 迁移到服务器数据库：
+
+    python3 data_transfer.py export backup.ndjson.gz
+    DATABASE_URL=postgresql://... python3 data_transfer.py import backup.ndjson.gz
+
+- 文件第一行为 header，之后每行一条记录 {"t": 表名, "r": {列: 值}}；以 .gz 结尾时自动压缩
+- 导出按主键顺序流式读取 (yield_per)，内存占用与数据量无关
+- 导入按批插入，每批提交时在同一事务中记录已处理的行号；中断后重新执行同一命令
+  会从上次提交的位置继续
+- 导入完成后重建选手两两统计，并让客户端的增量同步游标失效 (全量重新同步)
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, date
+from sqlalchemy import select, func, text, DateTime, Date
+from models import db, SCHEMA_VERSION_COUNTER
+from versioning import read_counter, set_counter, GLOBAL_COUNTER, CHANGE_LOG_FLOOR_COUNTER
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+FORMAT_NAME = 'laopen-ndjson'
+FORMAT_VERSION = 1
+
+# 按外键依赖顺序导出/导入；player_pair_stats 可由比赛重建，change_log 只是同步缓冲，均不导出
+TABLES = ('users', 'matches', 'match_participants', 'games', 'games_archive', 'change_counters')
+
+# 使用自增主键的表 (导入后需重置 PostgreSQL 序列)
+SERIAL_TABLES = ('users', 'matches', 'games')
+
+DEFAULT_BATCH_SIZE = 2000
+
+# 导入进度保存在 change_counters 中，名称带上文件 header 的摘要
+CHECKPOINT_PREFIX = 'import:'
+
+
+def _open(path, mode, compressed=None):
+    if compressed is None:
+        compressed = path.endswith('.gz')
+    if compressed:
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    return open(path, mode, encoding='utf-8')
+
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _loads(line):
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+def _encode_row(row):
+    return {key: value.isoformat() if isinstance(value, (datetime, date)) else value
+            for key, value in row.items()}
+
+
+def _date_columns(table):
+    """需要从 ISO 字符串还原的日期时间列"""
+    columns = {}
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            columns[column.name] = datetime.fromisoformat
+        elif isinstance(column.type, Date):
+            columns[column.name] = date.fromisoformat
+    return columns
+
+
+def export_data(path, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """流式导出全部数据，返回 {表名: 行数}"""
+    counts = {}
+    with _open(path + '.tmp', 'w', compressed=path.endswith('.gz')) as f:
+        f.write(_dumps({
+            't': 'header',
+            'format': FORMAT_NAME,
+            'version': FORMAT_VERSION,
+            'exported_at': datetime.utcnow().isoformat(),
+            'tables': list(TABLES),
+        }) + '\n')
+
+        with db.engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True, yield_per=batch_size)
+            for name in TABLES:
+                table = db.metadata.tables[name]
+                counts[name] = 0
+                result = conn.execute(select(table).order_by(*table.primary_key.columns))
+                for partition in result.mappings().partitions():
+                    f.write(''.join(_dumps({'t': name, 'r': _encode_row(row)}) + '\n' for row in partition))
+                    counts[name] += len(partition)
+                    if progress:
+                        progress(name, counts[name])
+
+    # 写完再改名，中途失败不会留下半个备份文件
+    os.replace(path + '.tmp', path)
+    return counts
+
+
+def _checkpoint_name(header_line):
+    return CHECKPOINT_PREFIX + hashlib.sha1(header_line.encode('utf-8')).hexdigest()[:16]
+
+
+def _reset_sequences(conn):
+    """PostgreSQL 中显式写入了主键，需把序列推进到最大ID之后"""
+    if conn.dialect.name != 'postgresql':
+        return
+    for name in SERIAL_TABLES:
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {name}), 0) + 1, false)"
+        ))
+
+
+def import_data(path, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    按批导入 NDJSON 备份，返回 {表名: 本次导入行数}
+    目标库必须为空，或者存在同一文件未完成的导入进度 (断点续传)
+    """
+    with _open(path, 'r') as f:
+        header_line = f.readline()
+        header = _loads(header_line) if header_line.strip() else {}
+        if header.get('format') != FORMAT_NAME or header.get('version', 0) > FORMAT_VERSION:
+            raise ValueError(f'{path} 不是 {FORMAT_NAME} v{FORMAT_VERSION} 格式的备份文件')
+
+        checkpoint_name = _checkpoint_name(header_line)
+        resume_from = read_counter(db.session, checkpoint_name)
+        if not resume_from:
+            existing = db.session.execute(select(func.count()).select_from(db.metadata.tables['users'])).scalar()
+            if existing:
+                raise ValueError('目标数据库已有数据，请导入到空数据库')
+        db.session.rollback()
+
+        tables = {name: db.metadata.tables[name] for name in TABLES}
+        date_columns = {name: _date_columns(table) for name, table in tables.items()}
+        counts = {name: 0 for name in TABLES}
+
+        pending_table, pending_rows, last_line = None, [], resume_from
+
+        def flush():
+            """插入一批并在同一事务中记录进度"""
+            with db.engine.begin() as conn:
+                if pending_table == 'change_counters':
+                    # 目标库可能已有同名计数器，逐个覆盖
+                    for row in pending_rows:
+                        set_counter(conn, row['name'], row['value'])
+                else:
+                    conn.execute(tables[pending_table].insert(), pending_rows)
+                set_counter(conn, checkpoint_name, last_line)
+            counts[pending_table] += len(pending_rows)
+            if progress:
+                progress(pending_table, counts[pending_table])
+
+        # header 为第1行，记录从第2行开始
+        for line_number, line in enumerate(f, 2):
+            if line_number <= resume_from or not line.strip():
+                continue
+
+            record = _loads(line)
+            name = record.get('t')
+            if name not in tables:
+                continue
+            if name == 'change_counters' and (record['r'].get('name', '').startswith(CHECKPOINT_PREFIX)
+                                              or record['r'].get('name') == SCHEMA_VERSION_COUNTER):
+                # 结构版本戳属于目标库本身，不随数据迁移
+                continue
+            if pending_rows and (name != pending_table or len(pending_rows) >= batch_size):
+                flush()
+                pending_rows = []
+
+            pending_table = name
+            columns = tables[name].columns
+            row = {key: value for key, value in record['r'].items() if key in columns}
+            for key, parse in date_columns[name].items():
+                if row.get(key) is not None:
+                    row[key] = parse(row[key])
+            pending_rows.append(row)
+            last_line = line_number
+
+        if pending_rows:
+            flush()
+
+    # 收尾：重建派生数据，增量同步游标全部失效，删除进度记录
+    from pair_stats import rebuild_pair_stats
+    rebuild_pair_stats()
+
+    with db.engine.begin() as conn:
+        _reset_sequences(conn)
+        version = conn.execute(
+            select(db.metadata.tables['change_counters'].c.value)
+            .where(db.metadata.tables['change_counters'].c.name == GLOBAL_COUNTER)
+        ).scalar() or 0
+        set_counter(conn, CHANGE_LOG_FLOOR_COUNTER, version)
+        table = db.metadata.tables['change_counters']
+        conn.execute(table.delete().where(table.c.name == checkpoint_name))
+
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+    from app import create_app
+    from models import init_db
+
+    parser = argparse.ArgumentParser(description='LaOpen 数据导出/导入 (NDJSON)')
+    parser.add_argument('command', choices=('export', 'import'))
+    parser.add_argument('path', help='备份文件路径，以 .gz 结尾时自动压缩')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    def report(name, count):
+        if count % (args.batch_size * 25) < args.batch_size:
+            print(f"  … {name}: {count}")
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        try:
+            if args.command == 'export':
+                print(f"📤 正在导出到 {args.path} ...")
+                counts = export_data(args.path, args.batch_size, report)
+            else:
+                if not init_db(app):
+                    sys.exit(1)
+                print(f"📥 正在从 {args.path} 导入 ...")
+                counts = import_data(args.path, args.batch_size, report)
+        except (OSError, ValueError) as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+        for name, count in counts.items():
+            print(f"  ✅ {name}: {count} 行")
+        print(f"⏱️  耗时 {time.perf_counter() - started:.1f}s")
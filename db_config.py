@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 数据库连接配置
+SQLite 生产调优参数 (每个新连接执行 PRAGMA) 以及服务器数据库的连接池设置；
+设置了 DATABASE_READ_URL 时以相同参数注册只读副本引擎 (路由见 read_replica.py)
+"""
+
+import os
+from sqlalchemy import event
+from read_replica import READ_REPLICA_BIND, replica_engine_config
+
+# SQLite 默认调优参数，均可通过同名大写环境变量覆盖 (如 SQLITE_BUSY_TIMEOUT)
+SQLITE_PRAGMA_DEFAULTS = {
+    'journal_mode': 'WAL',        # 读写互不阻塞
+    'synchronous': 'NORMAL',      # WAL 模式下安全且少一次 fsync
+    'busy_timeout': 5000,         # 被锁时最多等待的毫秒数，而不是立即报 database is locked
+    'mmap_size': 268435456,       # 256MB 内存映射读
+    'cache_size': -65536,         # 负数表示 KiB，即 64MB 页缓存
+    'temp_store': 'MEMORY',       # 临时表/排序放在内存
+}
+
+# 服务器数据库 (PostgreSQL/MySQL) 连接池默认值，环境变量 DB_POOL_SIZE 等覆盖
+POOL_DEFAULTS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+}
+
+
+def _env_value(name, default):
+    """读取环境变量，按默认值的类型转换"""
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    if isinstance(default, int):
+        return int(value)
+    return value
+
+
+def is_sqlite_url(database_url: str) -> bool:
+    return database_url.startswith('sqlite')
+
+
+def load_sqlite_pragmas() -> dict:
+    """合并默认值和环境变量得到 SQLite PRAGMA 配置"""
+    return {
+        name: _env_value('SQLITE_' + name.upper(), default)
+        for name, default in SQLITE_PRAGMA_DEFAULTS.items()
+    }
+
+
+def engine_options(database_url: str, sqlite_pragmas: dict) -> dict:
+    """根据数据库类型生成 SQLALCHEMY_ENGINE_OPTIONS"""
+    if is_sqlite_url(database_url):
+        # sqlite3 驱动自身的锁等待 (秒)，与 busy_timeout 保持一致
+        return {'connect_args': {'timeout': sqlite_pragmas['busy_timeout'] / 1000.0}}
+
+    options = {name: _env_value('DB_' + name.upper(), default) for name, default in POOL_DEFAULTS.items()}
+    options['pool_pre_ping'] = True
+    return options
+
+
+def configure_database(app):
+    """在 db.init_app 之前写入引擎配置"""
+    database_url = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config.setdefault('SQLITE_PRAGMAS', load_sqlite_pragmas())
+
+    options = engine_options(database_url, app.config['SQLITE_PRAGMAS'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    read_url = app.config.setdefault('DATABASE_READ_URL', os.environ.get('DATABASE_READ_URL') or None)
+    if read_url:
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds[READ_REPLICA_BIND] = replica_engine_config(
+            read_url, engine_options(read_url, app.config['SQLITE_PRAGMAS']))
+
+
+def register_sqlite_pragmas(app, db):
+    """在 db.init_app 之后调用：为 SQLite 引擎 (含只读副本) 的每个新连接应用 PRAGMA"""
+    pragmas = app.config['SQLITE_PRAGMAS']
+
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _apply_pragmas)
+
+
+def effective_settings(db) -> dict:
+    """读取当前连接上实际生效的设置 (需在应用上下文中调用)"""
+    engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            return {
+                name: conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+                for name in SQLITE_PRAGMA_DEFAULTS
+            }
+
+    pool = engine.pool
+    settings = {'pool_class': type(pool).__name__}
+    for name in ('size', 'timeout'):
+        getter = getattr(pool, name, None)
+        if callable(getter):
+            settings['pool_' + name] = getter()
+    settings['max_overflow'] = getattr(pool, '_max_overflow', None)
+    settings['pool_recycle'] = getattr(pool, '_recycle', None)
+    settings['pool_pre_ping'] = getattr(pool, '_pre_ping', None)
+    return settings
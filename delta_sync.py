@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 增量同步
+客户端带上次拿到的版本号请求 /matches/api/changes?since=<version>，只返回之后
+变化的赛事、比赛和参与者；响应中的 version 是下一次请求的游标。
+
+以下情况返回全量快照 (full=true，客户端丢弃本地数据后重建)：
+- 没有游标 (首次同步)
+- 游标早于 change_log 的保留范围 (客户端落后太多)
+- 变化条目超过 MAX_DELTA_ENTRIES
+"""
+
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select, func, tuple_
+from models import db, Match, Game, User, ChangeLog, match_participants, participant_counts, games_of_matches
+from versioning import read_counter, CHANGE_LOG_FLOOR_COUNTER
+
+# 单次增量返回的最大变化条目数，超出时改为全量快照
+MAX_DELTA_ENTRIES = 1000
+
+# 全量快照包含的赛事状态 (与赛事列表一致)
+SNAPSHOT_STATUSES = ('preparing', 'registering', 'ongoing')
+
+
+def match_payload(match: Match, participant_count: int) -> dict:
+    return {
+        'id': match.id,
+        'name': match.name,
+        'location': match.location,
+        'start_datetime': match.start_datetime.isoformat(),
+        'status': match.status,
+        'participants': participant_count,
+        'max_participants': match.max_participants,
+        'match_type': match.match_type,
+        'version': match.change_version,
+    }
+
+
+def game_payload(game: Game) -> dict:
+    team1_ids, team2_ids = game.player_ids
+    return {
+        'id': game.id,
+        'match_id': game.match_id,
+        'round': game.round_number,
+        'round_name': game.round_name,
+        'type': game.game_type,
+        'status': game.status,
+        'version': game.version,
+        'winner_team': game.winner_team,
+        'score': game.score_summary,
+        'court': game.court,
+        'scheduled_time': game.scheduled_time.isoformat() if game.scheduled_time else None,
+        'team1': team1_ids,
+        'team2': team2_ids,
+    }
+
+
+def _participants_of(match_ids=(), pairs=()) -> list:
+    """按赛事ID或 (赛事ID, 用户ID) 对查询参与者"""
+    query = select(match_participants.c.match_id, User.id, User.nickname).join(
+        User, User.id == match_participants.c.user_id)
+    if match_ids:
+        query = query.where(match_participants.c.match_id.in_(match_ids))
+    elif pairs:
+        query = query.where(tuple_(match_participants.c.match_id, match_participants.c.user_id).in_(pairs))
+    else:
+        return []
+    return [{'match_id': match_id, 'user_id': user_id, 'nickname': nickname}
+            for match_id, user_id, nickname in db.session.execute(query)]
+
+
+def _empty(version: int, full: bool) -> dict:
+    return {
+        'version': version,
+        'full': full,
+        'matches': [],
+        'games': [],
+        'participants': [],
+        # 这些赛事的比赛和参与者列表需整体替换
+        'reset': [],
+        'deleted': {'matches': [], 'games': [], 'participants': []},
+    }
+
+
+def full_snapshot(version: int) -> dict:
+    """进行中赛事的全量数据"""
+    result = _empty(version, True)
+    matches = Match.query.filter(Match.status.in_(SNAPSHOT_STATUSES)).order_by(Match.start_datetime.asc()).all()
+    match_ids = [match.id for match in matches]
+    counts = participant_counts(match_ids)
+
+    result['matches'] = [match_payload(match, counts.get(match.id, 0)) for match in matches]
+    if match_ids:
+        games = Game.query.filter(Game.match_id.in_(match_ids)).order_by(Game.id).all()
+        result['games'] = [game_payload(game) for game in games]
+    result['participants'] = _participants_of(match_ids=match_ids)
+    result['reset'] = match_ids
+    return result
+
+
+def _version_at(since_time: datetime, current: int, floor: int) -> Optional[int]:
+    """把时间戳换算成版本号游标；早于保留范围时返回 None"""
+    earliest, first_after = db.session.execute(
+        select(func.min(ChangeLog.created_at),
+               func.min(ChangeLog.version).filter(ChangeLog.created_at >= since_time))
+    ).one()
+    if floor and (earliest is None or since_time < earliest):
+        return None
+    if first_after is None:
+        return current
+    return first_after - 1
+
+
+def changes_since(since: Optional[int] = None, since_time: Optional[datetime] = None) -> dict:
+    """返回游标之后的变化；需要时退回全量快照"""
+    current = read_counter(db.session)
+    floor = read_counter(db.session, CHANGE_LOG_FLOOR_COUNTER)
+
+    if since_time is not None:
+        since = _version_at(since_time, current, floor)
+    if not since or since < floor or since > current:
+        return full_snapshot(current)
+    if since == current:
+        return _empty(current, False)
+
+    rows = db.session.execute(
+        select(ChangeLog.entity, ChangeLog.entity_id, ChangeLog.match_id).distinct()
+        .where(ChangeLog.version > since, ChangeLog.version <= current)
+        .limit(MAX_DELTA_ENTRIES + 1)
+    ).all()
+    if len(rows) > MAX_DELTA_ENTRIES:
+        return full_snapshot(current)
+
+    match_ids, reset_ids, game_ids, pairs = set(), set(), set(), set()
+    for entity, entity_id, match_id in rows:
+        if entity == 'match':
+            match_ids.add(entity_id)
+        elif entity == 'match_all':
+            reset_ids.add(entity_id)
+        elif entity == 'game':
+            game_ids.add(entity_id)
+        elif entity == 'participant':
+            pairs.add((match_id, entity_id))
+
+    result = _empty(current, False)
+
+    # 赛事：按当前状态下发，已不存在的视为删除
+    wanted_matches = match_ids | reset_ids
+    matches = Match.query.filter(Match.id.in_(wanted_matches)).all() if wanted_matches else []
+    counts = participant_counts([match.id for match in matches])
+    result['matches'] = [match_payload(match, counts.get(match.id, 0)) for match in matches]
+    result['deleted']['matches'] = sorted(wanted_matches - {match.id for match in matches})
+
+    # 需整体替换的赛事：下发全部比赛和参与者
+    reset_ids &= {match.id for match in matches}
+    result['reset'] = sorted(reset_ids)
+    games = []
+    if reset_ids:
+        # 刚归档的赛事也会整体重新下发，比赛从归档表读取
+        games.extend(games_of_matches(reset_ids))
+        result['participants'].extend(_participants_of(match_ids=reset_ids))
+    game_ids -= {game.id for game in games}
+    if game_ids:
+        found = Game.query.filter(Game.id.in_(game_ids)).all()
+        games.extend(found)
+        result['deleted']['games'] = sorted(game_ids - {game.id for game in found})
+    result['games'] = [game_payload(game) for game in sorted(games, key=lambda game: game.id)]
+
+    # 参与者：仍在赛事中的为加入，不在的为退出
+    pairs = {pair for pair in pairs if pair[0] not in reset_ids}
+    if pairs:
+        present = _participants_of(pairs=list(pairs))
+        result['participants'].extend(present)
+        left = pairs - {(item['match_id'], item['user_id']) for item in present}
+        result['deleted']['participants'] = [list(pair) for pair in sorted(left)]
+
+    return result
@@ -16,6 +16,8 @@ def check_files():
     
     required_files = [
         'app.py',
+        'wsgi.py',
+        'gunicorn.conf.py',
         'requirements.txt', 
         'Procfile',
         'models.py',
@@ -137,6 +139,33 @@ def test_app_locally():
         print(f"  ❌ 应用测试失败: {e}")
         return False
 
+def check_database_profile():
+    """显示数据库实际生效的调优参数"""
+    print("\n🗄️  检查数据库调优参数...")
+    
+    try:
+        from app import create_app
+        from models import db
+        from db_config import effective_settings
+        
+        app = create_app()
+        with app.app_context():
+            print(f"  📋 引擎: {db.engine.dialect.name}")
+            print(f"  📋 引擎参数: {app.config.get('SQLALCHEMY_ENGINE_OPTIONS')}")
+            settings = effective_settings(db)
+        
+        for name, value in settings.items():
+            print(f"  ✅ {name} = {value}")
+        
+        if settings.get('journal_mode', 'wal').lower() != 'wal':
+            print("  ⚠️  SQLite未启用WAL模式，并发写入时可能出现 database is locked")
+            return False
+        return True
+        
+    except Exception as e:
+        print(f"  ❌ 数据库参数检查失败: {e}")
+        return False
+
 def generate_env_template():
     """生成环境变量模板"""
     print("\n📝 生成环境变量模板...")
@@ -152,6 +181,52 @@ SECRET_KEY=your-super-secret-key-here-make-it-very-strong
 DATABASE_URL=sqlite:///instance/laopen.db
 PORT=5000
 
+# 生产服务器 (gunicorn.conf.py / wsgi.py)
+# WEB_CONCURRENCY=3
+# WEB_THREADS=16
+# WEB_MAX_REQUESTS=1000
+# WEB_GRACEFUL_TIMEOUT=30
+# WEB_WORKER_CLASS=gevent  (需安装 gevent；SSE 长连接较多时使用)
+
+# 赛事实时推送 (见 live_updates.py)，LIVE_MAX_STREAMS 默认为 WEB_THREADS - 2，超出的页面改为轮询
+# LIVE_POLL_INTERVAL=1
+# LIVE_STREAM_MAX_SECONDS=300
+# LIVE_MAX_STREAMS=14
+
+# 性能监控 (/metrics，见 metrics.py)
+# SLOW_REQUEST_MS=500
+# SLOW_QUERY_MS=100
+# METRICS_TOKEN=抓取时使用的Bearer令牌 (生产环境不设置时 /metrics 返回 404)
+
+# 密码哈希 (见 passwords.py)，不设置 BCRYPT_ROUNDS 时按目标耗时自动校准
+# BCRYPT_TARGET_MS=250
+# BCRYPT_ROUNDS=12
+# BCRYPT_MAX_WORKERS=2
+
+# 登录限流 (见 rate_limit.py)，sqlite 后端在多个 worker 间共享
+# LOGIN_LIMITER_BACKEND=sqlite
+# LOGIN_RATE_PER_MINUTE=5
+# LOGIN_IP_RATE_PER_MINUTE=30
+# LOGIN_TRUSTED_PROXIES=1
+
+# SQLite 调优参数 (默认值见 db_config.py)
+# SQLITE_JOURNAL_MODE=WAL
+# SQLITE_SYNCHRONOUS=NORMAL
+# SQLITE_BUSY_TIMEOUT=5000
+# SQLITE_MMAP_SIZE=268435456
+# SQLITE_CACHE_SIZE=-65536
+# SQLITE_TEMP_STORE=MEMORY
+
+# 服务器数据库连接池 (DATABASE_URL 为 PostgreSQL/MySQL 时生效)
+# DB_POOL_SIZE=5
+# DB_MAX_OVERFLOW=10
+# DB_POOL_TIMEOUT=30
+# DB_POOL_RECYCLE=1800
+
+# 只读副本 (见 read_replica.py)：GET/HEAD 请求的查询发到副本，写入后的窗口期内仍读主库
+# DATABASE_READ_URL=postgresql://readonly@replica-host/laopen
+# READ_YOUR_WRITES_SECONDS=5
+
 # 部署平台会自动设置的变量
 # PORT (Render, Heroku等会自动设置)
 # DATABASE_URL (如果使用平台提供的数据库)
@@ -175,7 +250,8 @@ def show_deployment_instructions():
     print("   • 选择你的仓库")
     print("   • 配置:")
     print("     - Build Command: pip install -r requirements.txt")
-    print("     - Start Command: python app.py")
+    print("     - Start Command: gunicorn -c gunicorn.conf.py wsgi:app")
+    print("     - 可选: WEB_CONCURRENCY / WEB_THREADS / WEB_MAX_REQUESTS 调整进程、线程和回收")
     print("     - 设置环境变量 FLASK_ENV=production")
     
     print("\n2️⃣  备选方案 - Railway.app:")
@@ -200,6 +276,7 @@ def main():
         ("依赖检查", check_requirements), 
         ("Git状态", check_git_status),
         ("应用测试", test_app_locally),
+        ("数据库参数", check_database_profile),
     ]
     
     passed_checks = 0
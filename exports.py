@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 赛程导出
+- 单个赛事的比赛列表导出为 CSV (表格) 和 iCalendar (日历)
+- 每个用户一个 ICS 订阅地址 (带签名令牌，日历应用无需登录)，
+  支持 ETag/Last-Modified，日历应用定时轮询时大多直接返回 304
+
+导出内容由生成器逐块输出，比赛按批读取，不在内存中拼出整个文件。
+时间按赛事录入的本地时间输出 (ICS 中为不带时区的 floating time)
+"""
+
+import csv
+import io
+from datetime import datetime, timedelta
+from flask import current_app, request, stream_with_context
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import select, func, or_, union
+from models import db, Match, Game, ArchivedGame, User, match_participants, game_model_for
+from versioning import make_etag, with_etag
+
+# 每批读取的比赛数，也是每次输出的块大小
+EXPORT_BATCH_SIZE = 200
+
+# 日历中每场比赛至少显示该时长 (实际结束更晚时以实际为准)
+DEFAULT_GAME_MINUTES = 60
+
+CSV_COLUMNS = ('game_id', 'round', 'round_name', 'type', 'scheduled_time', 'court',
+               'team1', 'team2', 'status', 'score', 'winner_team')
+
+CALENDAR_TOKEN_SALT = 'laopen-calendar-feed'
+
+
+# ---- 通用 ----
+
+def _player_names(match_ids):
+    """一次查出这些赛事 (含已归档的) 中所有出场选手的昵称 {user_id: nickname}"""
+    player_ids = union(*[
+        select(column).where(model.match_id.in_(match_ids), column.isnot(None))
+        for model in (Game, ArchivedGame)
+        for column in (model.player1_id, model.player2_id, model.player3_id, model.player4_id)
+    ]).subquery()
+    rows = db.session.execute(select(User.id, User.nickname).where(User.id.in_(select(player_ids)))).all()
+    return dict(rows)
+
+
+def _team_names(game, names):
+    team1_ids, team2_ids = game.player_ids
+    return (' & '.join(names.get(user_id, '?') for user_id in team1_ids),
+            ' & '.join(names.get(user_id, '?') for user_id in team2_ids))
+
+
+def _iter_games(model, *criteria):
+    """按批读取比赛 (yield_per)，避免一次加载整个赛事；model 为 Game 或 ArchivedGame"""
+    query = (
+        select(model).where(*criteria)
+        .order_by(model.round_number.asc(), model.scheduled_time.asc(), model.id.asc())
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    return db.session.execute(query).scalars()
+
+
+def _chunked(lines):
+    """把逐行输出合并为大约 EXPORT_BATCH_SIZE 行一块，减少写 socket 的次数"""
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= EXPORT_BATCH_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def streaming_response(lines, mimetype, filename=None):
+    """生成器在请求上下文中运行 (需要数据库会话)，按块输出"""
+    response = current_app.response_class(stream_with_context(_chunked(lines)), mimetype=mimetype)
+    if filename:
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# ---- CSV ----
+
+def _csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def match_csv_lines(match):
+    """赛事比赛列表的 CSV 行"""
+    names = _player_names([match.id])
+    yield '\ufeff'  # BOM，Excel 打开中文昵称不乱码
+    yield _csv_line(CSV_COLUMNS)
+    model = game_model_for(match)
+    for game in _iter_games(model, model.match_id == match.id):
+        team1, team2 = _team_names(game, names)
+        yield _csv_line((
+            game.id, game.round_number, game.round_name or '', game.game_type,
+            game.scheduled_time.strftime('%Y-%m-%d %H:%M') if game.scheduled_time else '',
+            game.court or '', team1, team2, game.status,
+            game.score_summary if game.is_finished else '', game.winner_team or '',
+        ))
+
+
+# ---- iCalendar ----
+
+def _ics_escape(text):
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _ics_fold(line):
+    """RFC 5545：每行不超过75字节，续行以空格开头"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, current, size = [], '', 0
+    for char in line:
+        char_size = len(char.encode('utf-8'))
+        if size + char_size > (75 if not parts else 74):
+            parts.append(current)
+            current, size = '', 0
+        current += char
+        size += char_size
+    parts.append(current)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _ics_time(value):
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def _ics_header(name):
+    yield _ics_fold('BEGIN:VCALENDAR')
+    yield _ics_fold('VERSION:2.0')
+    yield _ics_fold('PRODID:-//LaOpen Tennis//Schedule//EN')
+    yield _ics_fold('CALSCALE:GREGORIAN')
+    yield _ics_fold(f'X-WR-CALNAME:{_ics_escape(name)}')
+
+
+def _ics_event(game, match, names, stamp):
+    start = game.scheduled_time or match.start_datetime
+    end = start + timedelta(minutes=DEFAULT_GAME_MINUTES)
+    if game.actual_end_time and game.actual_end_time > end:
+        end = game.actual_end_time
+    team1, team2 = _team_names(game, names)
+    location = match.location + (f' - {game.court}' if game.court else '')
+    description = f'{game.round_name or f"Round {game.round_number}"} | {game.status.title()}'
+    if game.is_finished:
+        description += f' | {game.score_summary}'
+
+    yield _ics_fold('BEGIN:VEVENT')
+    yield _ics_fold(f'UID:game-{game.id}@laopen')
+    yield _ics_fold(f'DTSTAMP:{_ics_time(stamp)}Z')
+    yield _ics_fold(f'DTSTART:{_ics_time(start)}')
+    yield _ics_fold(f'DTEND:{_ics_time(end)}')
+    # 比赛每次修改版本号 +1，日历应用据此更新已有事件
+    yield _ics_fold(f'SEQUENCE:{game.version}')
+    yield _ics_fold(f'SUMMARY:{_ics_escape(f"{team1} vs {team2} ({match.name})")}')
+    yield _ics_fold(f'LOCATION:{_ics_escape(location)}')
+    yield _ics_fold(f'DESCRIPTION:{_ics_escape(description)}')
+    if game.status == 'cancelled':
+        yield _ics_fold('STATUS:CANCELLED')
+    yield _ics_fold('END:VEVENT')
+
+
+def match_ics_lines(match):
+    """赛事所有比赛的 iCalendar 内容"""
+    names = _player_names([match.id])
+    stamp = datetime.utcnow()
+    yield from _ics_header(match.name)
+    model = game_model_for(match)
+    for game in _iter_games(model, model.match_id == match.id):
+        yield from _ics_event(game, match, names, stamp)
+    yield _ics_fold('END:VCALENDAR')
+
+
+# ---- 个人日历订阅 ----
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt=CALENDAR_TOKEN_SALT)
+
+
+def calendar_token(user):
+    return _serializer().dumps(user.id)
+
+
+def user_from_calendar_token(token):
+    try:
+        user_id = _serializer().loads(token)
+    except BadSignature:
+        return None
+    return db.session.get(User, user_id)
+
+
+def _user_match_ids(user):
+    return select(match_participants.c.match_id).where(match_participants.c.user_id == user.id)
+
+
+def calendar_validators(user):
+    """
+    订阅内容只取决于用户参与的赛事，这些赛事的 change_version 和 updated_at
+    在任何比赛变化时都会更新，一条聚合查询即可得到 ETag 和 Last-Modified
+    """
+    version_sum, last_modified, match_count = db.session.execute(
+        select(func.sum(Match.change_version), func.max(Match.updated_at), func.count(Match.id))
+        .where(Match.id.in_(_user_match_ids(user)))
+    ).one()
+    etag = make_etag('calendar', user.id, match_count, version_sum or 0)
+    return etag, last_modified
+
+
+def calendar_not_modified(etag, last_modified):
+    """If-None-Match 优先；没有时按 If-Modified-Since 判断"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def user_ics_lines(user):
+    """用户在所参与赛事中的全部比赛"""
+    matches = {match.id: match for match in Match.query.filter(Match.id.in_(_user_match_ids(user)),
+                                                              Match.status != 'cancelled')}
+    if not matches:
+        yield from _ics_header(f'LaOpen - {user.nickname}')
+        yield _ics_fold('END:VCALENDAR')
+        return
+
+    names = _player_names(list(matches))
+    stamp = datetime.utcnow()
+    yield from _ics_header(f'LaOpen - {user.nickname}')
+    for model, archived in ((Game, False), (ArchivedGame, True)):
+        match_ids = [match_id for match_id, match in matches.items() if bool(match.archived_at) == archived]
+        if not match_ids:
+            continue
+        games = _iter_games(
+            model,
+            model.match_id.in_(match_ids),
+            or_(model.player1_id == user.id, model.player2_id == user.id,
+                model.player3_id == user.id, model.player4_id == user.id),
+        )
+        for game in games:
+            yield from _ics_event(game, matches[game.match_id], names, stamp)
+    yield _ics_fold('END:VCALENDAR')
+
+
+def calendar_feed_response(user):
+    """个人日历订阅响应，内容未变时返回 304"""
+    etag, last_modified = calendar_validators(user)
+    if calendar_not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = streaming_response(user_ics_lines(user), 'text/calendar')
+    response.last_modified = last_modified
+    return with_etag(response, etag)
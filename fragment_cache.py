@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 页面片段缓存
+缓存赛事详情页中渲染好的比赛列表和参与者列表，按 (赛事ID, 片段名) 存储，
+并记录生成时的版本号；版本号变化 (见 versioning.py) 时旧片段立即失效。
+内存占用受条目数和总大小 (按字符数估算) 限制，超出时按 LRU 淘汰
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from markupsafe import Markup
+from metrics import registry
+
+registry.describe('laopen_fragment_cache_total', 'counter', 'Fragment cache lookups by result')
+
+
+class FragmentCache:
+    """线程安全的 LRU 片段缓存 (每个进程一份)"""
+
+    def __init__(self, max_entries=512, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # {(match_id, name): (version, html)}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_entries=None, max_bytes=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, html) = self._entries.popitem(last=False)
+            self._bytes -= len(html)
+
+    def get(self, match_id, name, version):
+        """命中返回 HTML；版本号不一致时删除旧片段并返回 None"""
+        key = (match_id, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != version:
+                del self._entries[key]
+                self._bytes -= len(entry[1])
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, match_id, name, version, html):
+        key = (match_id, name)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            if len(html) > self.max_bytes:
+                return
+            self._entries[key] = (version, html)
+            self._bytes += len(html)
+            self._evict()
+
+    def invalidate(self, match_id):
+        """删除某个赛事的所有片段"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == match_id]:
+                self._bytes -= len(self._entries.pop(key)[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_or_render(self, match_id, name, version, render):
+        """命中直接返回，否则调用 render() 渲染并缓存"""
+        html = self.get(match_id, name, version)
+        if html is None:
+            registry.inc('laopen_fragment_cache_total', fragment=name, result='miss')
+            html = render()
+            self.set(match_id, name, version, html)
+        else:
+            registry.inc('laopen_fragment_cache_total', fragment=name, result='hit')
+        return Markup(html)
+
+
+# 进程级单例
+fragment_cache = FragmentCache()
+
+
+def init_fragment_cache(app):
+    """从配置/环境变量读取缓存大小"""
+    app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 512)))
+    app.config.setdefault('FRAGMENT_CACHE_MAX_BYTES',
+                          int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024)))
+    fragment_cache.configure(app.config['FRAGMENT_CACHE_MAX_ENTRIES'], app.config['FRAGMENT_CACHE_MAX_BYTES'])
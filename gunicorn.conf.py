@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+LaOpen gunicorn 配置
+所有参数均可通过环境变量调整，默认值适合 1-2 核的小型实例
+"""
+
+import multiprocessing
+import os
+
+# 监听地址 (Render/Heroku 会注入 PORT)
+bind = '0.0.0.0:' + os.environ.get('PORT', '5000')
+
+# worker 进程数：默认 CPU核数*2+1，最多8个
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+
+# 每个 worker 的线程数；>1 时使用 gthread worker，bcrypt 等释放 GIL 的操作可以并行
+# 赛事直播 (SSE) 每个连接占用一个线程，默认除 2 个线程外都可用于推送 (见 live_updates.py)
+threads = int(os.environ.get('WEB_THREADS', 16))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# SSE 长连接 (/matches/<id>/stream) 在 gthread 下每个占用一个线程；
+# 连接较多时可设 WEB_WORKER_CLASS=gevent (需另行安装 gevent)
+worker_class = os.environ.get('WEB_WORKER_CLASS', worker_class)
+
+# 在 master 中预加载应用 (只初始化一次数据库，worker 共享只读内存页)
+preload_app = os.environ.get('WEB_PRELOAD', '1') == '1'
+
+# 请求超时与平滑重启：收到 HUP/TERM 后给正在处理的请求留出完成时间
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# worker 处理 N 个请求后自动回收，jitter 避免所有 worker 同时重启
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 100))
+
+# 多个 worker 的监控数据汇总目录 (见 metrics.py)
+os.environ.setdefault('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics'))
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """
+    master 启动时清空上一次运行留下的 worker 监控快照
+    只删除文件、保留目录：预加载模式下应用已先于此钩子创建了该目录
+    """
+    from metrics import remove_snapshots
+    remove_snapshots(os.environ['METRICS_DIR'])
+
+
+def child_exit(server, worker):
+    """worker 退出 (max_requests 回收、崩溃) 后删除它的监控快照"""
+    from metrics import remove_snapshots
+    remove_snapshots(os.environ['METRICS_DIR'], [worker.pid])
+
+
+def post_fork(server, worker):
+    """worker fork 之后丢弃继承自 master 的数据库连接"""
+    if preload_app:
+        from wsgi import reset_after_fork
+        reset_after_fork()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 登录用户缓存
+Flask-Login 每个请求都会调用 user_loader 查询一次 users 表。这里在进程内缓存
+用户的列值快照 (短 TTL、限制条目数)，命中时通过 session.merge(load=False)
+挂回当前会话而不发出 SQL；同一请求内重复加载直接复用。
+用户资料、积分或管理员标记变更的事务提交后立即失效 (其他 worker 依赖 TTL 过期)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import db, User
+from metrics import registry
+
+registry.describe('laopen_identity_cache_total', 'counter', 'Flask-Login user loader lookups by result')
+
+
+class IdentityCache:
+    """线程安全的 TTL + LRU 用户快照缓存"""
+
+    def __init__(self, max_entries=1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # {user_id: (expires_at, detached_user)}
+        self._lock = threading.Lock()
+
+    def configure(self, max_entries=None, ttl=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if ttl is not None:
+                self.ttl = ttl
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, snapshot):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# 进程级单例
+identity_cache = IdentityCache()
+
+
+def _snapshot(user):
+    """复制用户的列值，生成一个不属于任何会话的 detached 对象"""
+    snapshot = User(**{column.key: getattr(user, column.key) for column in User.__mapper__.column_attrs})
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+def load_user_cached(user_id):
+    """Flask-Login 的 user_loader 实现"""
+    user_id = int(user_id)
+
+    # 同一请求内去重
+    loaded = g.setdefault('identity_users', {}) if has_request_context() else {}
+    if user_id in loaded:
+        registry.inc('laopen_identity_cache_total', result='request')
+        return loaded[user_id]
+
+    snapshot = identity_cache.get(user_id)
+    if snapshot is not None:
+        registry.inc('laopen_identity_cache_total', result='hit')
+        user = db.session.merge(snapshot, load=False)
+    else:
+        registry.inc('laopen_identity_cache_total', result='miss')
+        user = db.session.get(User, user_id)
+        if user is not None:
+            identity_cache.set(user_id, _snapshot(user))
+
+    loaded[user_id] = user
+    return user
+
+
+# flush 期间在 session.info 中暂存本事务修改过的用户ID
+_SESSION_CHANGED_USERS_KEY = 'laopen_identity_changed_users'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    """记下通过 ORM 修改或删除的用户，提交后再失效"""
+    user_ids = [
+        obj.id for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, User) and obj.id is not None
+    ]
+    if user_ids:
+        session.info.setdefault(_SESSION_CHANGED_USERS_KEY, set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    """
+    提交之后才失效：若在 flush 时失效，提交前其他请求仍会读到旧行 (旧的 is_admin、密码哈希等)
+    并重新放回缓存，直到 TTL 过期
+    """
+    user_ids = session.info.pop(_SESSION_CHANGED_USERS_KEY, None)
+    if user_ids:
+        identity_cache.invalidate(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop(_SESSION_CHANGED_USERS_KEY, None)
+
+
+def init_identity_cache(app):
+    """从配置/环境变量读取缓存大小和 TTL"""
+    app.config.setdefault('IDENTITY_CACHE_TTL', float(os.environ.get('IDENTITY_CACHE_TTL', 30)))
+    app.config.setdefault('IDENTITY_CACHE_SIZE', int(os.environ.get('IDENTITY_CACHE_SIZE', 1024)))
+    identity_cache.configure(app.config['IDENTITY_CACHE_SIZE'], app.config['IDENTITY_CACHE_TTL'])
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 赛事实时推送 (Server-Sent Events)
+赛事详情页通过 /matches/<id>/stream 建立一个长连接，比赛状态和比分变化时
+推送精简的 JSON 增量，不必反复刷新整页。
+
+每个 worker 进程内有一个 LiveBroker：
+- 订阅者按赛事分组，每个连接一个有界队列
+- 有订阅者时，一个后台线程按间隔查询被订阅赛事的 change_version
+  (见 versioning.py)，版本变化才读取该赛事的比赛并与上次快照比较，
+  只把变化的比赛推送给本进程内的订阅者
+- 数据库就是跨 worker 的消息通道：无论比分由哪个 worker 写入，
+  每个 worker 都会在一个轮询间隔内看到版本变化；本进程写入时立即唤醒轮询
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from flask import current_app
+from sqlalchemy import select
+from models import db, Match, Game
+from metrics import registry
+
+registry.describe('laopen_live_streams_total', 'counter', 'SSE streams opened, closed and turned away (busy)')
+registry.describe('laopen_live_events_total', 'counter', 'SSE events published by type')
+
+# 客户端断线后的重连间隔 (毫秒)
+RETRY_MS = 3000
+
+# 连接数已满时让客户端等待多久再重连 (毫秒)，期间页面改为轮询 (见 static/js/live.js)
+BUSY_RETRY_MS = 30000
+
+# gthread worker 中留给普通请求的线程数，其余线程可用于 SSE 长连接
+RESERVED_REQUEST_THREADS = 2
+
+
+def game_state(game: Game) -> dict:
+    """推送给客户端的单场比赛状态"""
+    return {
+        'id': game.id,
+        'version': game.version,
+        'status': game.status,
+        'winner_team': game.winner_team,
+        'score': game.score_summary,
+        'court': game.court,
+    }
+
+
+def load_game_states(match_id) -> dict:
+    """读取赛事中所有比赛的当前状态 {game_id: state}"""
+    games = Game.query.filter_by(match_id=match_id).all()
+    return {game.id: game_state(game) for game in games}
+
+
+def format_event(event, data, event_id=None) -> str:
+    """按 text/event-stream 格式编码一条事件"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+class LiveBroker:
+    """进程内的赛事事件分发器"""
+
+    def __init__(self):
+        self.app = None
+        self.poll_interval = 1.0
+        self.keepalive = 15.0
+        self.max_stream_seconds = 300.0
+        self.max_streams = 2
+        self.queue_size = 32
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # {match_id: set(queue)}
+        self._states = {}  # {match_id: (change_version, {game_id: state})}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._streams = 0
+
+    def configure(self, app, poll_interval, keepalive, max_stream_seconds, max_streams, queue_size):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive
+        self.max_stream_seconds = max_stream_seconds
+        self.max_streams = max_streams
+        self.queue_size = queue_size
+
+    # ---- 订阅 ----
+
+    def subscribe(self, match_id, version, states):
+        """登记一个订阅者，连接数已满时返回 None"""
+        with self._lock:
+            if self._streams >= self.max_streams:
+                return None
+            self._streams += 1
+            subscriber = queue.Queue(maxsize=self.queue_size)
+            self._subscribers.setdefault(match_id, set()).add(subscriber)
+            # 已有更早的基线时保留它，轮询线程会把之间的变化推送出去
+            self._states.setdefault(match_id, (version, states))
+            self._ensure_thread()
+        registry.inc('laopen_live_streams_total', event='open')
+        return subscriber
+
+    def unsubscribe(self, match_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(match_id)
+            if subscribers is None or subscriber not in subscribers:
+                return
+            subscribers.discard(subscriber)
+            self._streams -= 1
+            if not subscribers:
+                del self._subscribers[match_id]
+                self._states.pop(match_id, None)
+        registry.inc('laopen_live_streams_total', event='close')
+
+    def publish(self, match_id, event, data, event_id=None):
+        """把事件放入该赛事所有订阅者的队列；队列已满的慢客户端改为通知其重新加载"""
+        message = format_event(event, data, event_id)
+        with self._lock:
+            subscribers = list(self._subscribers.get(match_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                _drain(subscriber)
+                subscriber.put_nowait(format_event('reload', {'match_id': match_id}, event_id))
+        registry.inc('laopen_live_events_total', event=event)
+
+    def notify(self):
+        """本进程刚写入比分/赛程时调用，立即触发一次轮询"""
+        self._wakeup.set()
+
+    # ---- 轮询 ----
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='live-updates', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            with self.app.app_context():
+                try:
+                    self.poll()
+                except Exception as e:
+                    self.app.logger.warning('实时推送轮询失败: %s', e)
+                finally:
+                    db.session.remove()
+
+    def poll(self):
+        """检查被订阅赛事的版本号，推送有变化的比赛"""
+        with self._lock:
+            known = {match_id: state[0] for match_id, state in self._states.items()}
+        if not known:
+            return
+
+        rows = db.session.execute(
+            select(Match.id, Match.change_version, Match.status).where(Match.id.in_(list(known)))
+        ).all()
+
+        for match_id, change_version, match_status in rows:
+            if change_version == known[match_id]:
+                continue
+
+            states = load_game_states(match_id)
+            with self._lock:
+                previous = self._states.get(match_id)
+                if previous is None:
+                    continue
+                self._states[match_id] = (change_version, states)
+
+            if set(states) != set(previous[1]):
+                # 赛程被重新生成 (比赛增删)，客户端重新加载整页
+                self.publish(match_id, 'reload', {'match_id': match_id}, change_version)
+                continue
+
+            changed = [state for game_id, state in states.items() if state != previous[1][game_id]]
+            if changed:
+                self.publish(match_id, 'games', {
+                    'match_id': match_id,
+                    'status': match_status,
+                    'games': changed,
+                }, change_version)
+
+    # ---- 响应 ----
+
+    def stream(self, match, last_event_id=None):
+        """
+        为赛事创建 SSE 响应
+        连接数已满时返回一个立即结束的 200 事件流：EventSource 对非 200 响应不会重连，
+        这里通过 retry 让它稍后重试，并发送 busy 事件让页面先改为轮询
+        """
+        states = load_game_states(match.id)
+        version = match.change_version
+        subscriber = self.subscribe(match.id, version, states)
+        if subscriber is None:
+            registry.inc('laopen_live_streams_total', event='busy')
+            response = current_app.response_class(
+                f'retry: {BUSY_RETRY_MS}\n\n' + format_event('busy', {'match_id': match.id}),
+                mimetype='text/event-stream')
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        # 重连时带上的版本号与当前一致则无需再发快照
+        initial = None
+        if last_event_id != str(version):
+            initial = format_event('snapshot', {
+                'match_id': match.id,
+                'status': match.status,
+                'games': list(states.values()),
+            }, version)
+
+        match_id = match.id
+        keepalive = self.keepalive
+        deadline = time.monotonic() + self.max_stream_seconds
+
+        # 生成器中不访问数据库，请求上下文结束后会话即归还连接
+        def generate():
+            try:
+                yield f'retry: {RETRY_MS}\n\n'
+                if initial:
+                    yield initial
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        # 定期断开，让客户端重连到其他 worker，也避免长期占用线程
+                        break
+                    try:
+                        yield subscriber.get(timeout=min(keepalive, remaining))
+                    except queue.Empty:
+                        yield ': keepalive\n\n'
+            finally:
+                self.unsubscribe(match_id, subscriber)
+
+        response = current_app.response_class(generate(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        # 客户端在生成器开始之前断开时 finally 不会执行，这里兜底注销
+        response.call_on_close(lambda: self.unsubscribe(match_id, subscriber))
+        return response
+
+
+def _drain(subscriber):
+    try:
+        while True:
+            subscriber.get_nowait()
+    except queue.Empty:
+        pass
+
+
+# 进程级单例
+live_broker = LiveBroker()
+
+if hasattr(os, 'register_at_fork'):
+    # fork 出的子进程中轮询线程不存在，订阅者也不属于该进程
+    os.register_at_fork(after_in_child=live_broker._reset)
+
+
+def _default_max_streams():
+    """
+    gthread/sync worker 中每个 SSE 连接占用一个线程，默认保留 RESERVED_REQUEST_THREADS 个线程
+    处理普通请求，其余都可用于推送；使用 gevent/eventlet worker 时连接很便宜，上限放宽
+    超出上限的页面退回轮询，不会失去比分更新
+    """
+    if os.environ.get('WEB_WORKER_CLASS') in ('gevent', 'eventlet'):
+        return 1000
+    return max(int(os.environ.get('WEB_THREADS', 16)) - RESERVED_REQUEST_THREADS, 1)
+
+
+def init_live_updates(app):
+    """从配置/环境变量读取推送参数"""
+    app.config.setdefault('LIVE_POLL_INTERVAL', float(os.environ.get('LIVE_POLL_INTERVAL', 1.0)))
+    app.config.setdefault('LIVE_KEEPALIVE', float(os.environ.get('LIVE_KEEPALIVE', 15)))
+    app.config.setdefault('LIVE_STREAM_MAX_SECONDS', float(os.environ.get('LIVE_STREAM_MAX_SECONDS', 300)))
+    app.config.setdefault('LIVE_MAX_STREAMS', int(os.environ.get('LIVE_MAX_STREAMS', 0)) or _default_max_streams())
+    app.config.setdefault('LIVE_QUEUE_SIZE', int(os.environ.get('LIVE_QUEUE_SIZE', 32)))
+
+    live_broker.configure(app,
+                          app.config['LIVE_POLL_INTERVAL'],
+                          app.config['LIVE_KEEPALIVE'],
+                          app.config['LIVE_STREAM_MAX_SECONDS'],
+                          app.config['LIVE_MAX_STREAMS'],
+                          app.config['LIVE_QUEUE_SIZE'])
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 压测工具 (仅依赖标准库)
+模拟比赛日的流量：大量并发的虚拟用户各自登录 (带 session cookie)，
+按配置的比例访问首页、赛事列表/详情、报名、API 和对阵生成，
+最后按接口输出吞吐量和 p50/p95/p99 延迟
+
+    # 1. 准备数据 (球员手机号 13000000001 起，密码 password123)
+    DATABASE_URL=sqlite:////tmp/bench.db python3 synthetic_data.py --users 5000 --matches 500 --fast
+    # 2. 以生产配置启动 (所有虚拟用户来自同一IP，需关闭登录限流)
+    DATABASE_URL=sqlite:////tmp/bench.db FLASK_ENV=production LOGIN_LIMITER_ENABLED=0 python3 wsgi.py
+    # 3. 压测
+    python3 load_test.py --url http://127.0.0.1:5000 --users 200 --duration 60
+
+- 每个虚拟用户一个线程，登录时从登录页解析 CSRF token
+- 不跟随重定向，记录的是接口本身的延迟 (报名、登录返回 302 视为成功)
+- 流量比例用 --mix 调整，如 --mix dashboard=30,match_detail=40,api_matches=30
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+# 比赛日的默认流量比例 (权重)
+DEFAULT_MIX = {
+    'dashboard': 15,
+    'match_list': 15,
+    'match_detail': 25,
+    'join_match': 5,
+    'api_matches': 15,
+    'api_match': 10,
+    'api_changes': 10,
+    'generate_matchup': 5,
+}
+
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+PERCENTILES = (50, 95, 99)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Stats:
+    """线程安全地收集每个接口的延迟和状态码"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def record(self, name, status, elapsed):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+            counts = self.statuses.setdefault(name, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def record_error(self, name, error):
+        with self._lock:
+            counts = self.errors.setdefault(name, {})
+            key = type(error).__name__
+            counts[key] = counts.get(key, 0) + 1
+
+
+def percentile(sorted_values, percent):
+    """最近秩法百分位"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percent / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class VirtualUser(threading.Thread):
+    """一个虚拟用户：独立的 cookie，登录后按权重随机访问接口直到结束"""
+
+    def __init__(self, index, options, stats, match_ids, stop_at):
+        super().__init__(daemon=True)
+        self.index = index
+        self.options = options
+        self.stats = stats
+        self.match_ids = match_ids
+        self.stop_at = stop_at
+        self.rng = random.Random(options.seed * 100003 + index)
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect())
+        self.change_version = 0
+        self.logged_in = False
+
+    # ---- HTTP ----
+
+    def request(self, name, path, data=None, record=True):
+        """发出请求并记录延迟，返回 (状态码, 响应体)；连接错误返回 (None, '')"""
+        url = self.options.url + path
+        body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(url, data=body, timeout=self.options.timeout) as response:
+                status, text = response.status, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            status, text = e.code, e.read().decode('utf-8', 'replace')
+        except (urllib.error.URLError, OSError) as e:
+            self.stats.record_error(name, e)
+            return None, ''
+        if record:
+            self.stats.record(name, status, time.perf_counter() - started)
+        return status, text
+
+    def login(self):
+        status, page = self.request('login_page', '/login')
+        match = CSRF_PATTERN.search(page)
+        form = {
+            'phone': self.options.phone_format.format(self.options.first_user + self.index),
+            'password': self.options.password,
+        }
+        if match:
+            form['csrf_token'] = match.group(1)
+        status, _ = self.request('login', '/login', form)
+        # 登录成功重定向到首页，失败时重新渲染登录页 (200)
+        self.logged_in = status == 302
+        return self.logged_in
+
+    # ---- 场景 ----
+
+    def _match_id(self):
+        return self.rng.choice(self.match_ids)
+
+    def dashboard(self):
+        self.request('dashboard', '/tennis/dashboard')
+
+    def match_list(self):
+        self.request('match_list', '/matches/')
+
+    def match_detail(self):
+        self.request('match_detail', f'/matches/{self._match_id()}')
+
+    def join_match(self):
+        match_id = self._match_id()
+        self.request('join_match', f'/matches/{match_id}/join',
+                     {'password': self.options.join_password.format(match_id)})
+
+    def api_matches(self):
+        self.request('api_matches', '/matches/api/matches?limit=20')
+
+    def api_match(self):
+        self.request('api_match', f'/matches/api/matches/{self._match_id()}')
+
+    def api_changes(self):
+        status, text = self.request('api_changes', f'/matches/api/changes?since={self.change_version}')
+        if status == 200:
+            try:
+                self.change_version = json.loads(text).get('version', self.change_version)
+            except ValueError:
+                pass
+
+    def generate_matchup(self):
+        players = [f'P{self.rng.randint(1, 9999)}' for _ in range(16)]
+        self.request('generate_matchup', '/tennis/generate_matchup', {
+            'match_format': 'doubles',
+            'matchup_type': 'AllRandom',
+            'rounds': 3,
+            'courts_count': 4,
+            'participants': ','.join(players),
+        })
+
+    def run(self):
+        if self.options.ramp_up:
+            time.sleep(self.options.ramp_up * self.index / max(self.options.users, 1))
+        if not self.login():
+            return
+
+        names = list(self.options.mix)
+        weights = [self.options.mix[name] for name in names]
+        while time.monotonic() < self.stop_at:
+            scenario = self.rng.choices(names, weights)[0]
+            getattr(self, scenario)()
+            if self.options.think_time:
+                time.sleep(self.rng.uniform(0, self.options.think_time * 2))
+
+
+def parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    if text:
+        mix = {}
+        for part in text.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if name not in DEFAULT_MIX:
+                raise argparse.ArgumentTypeError(f"未知场景 '{name}'，可选：{', '.join(DEFAULT_MIX)}")
+            mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def parse_match_ids(text):
+    """'1-500' 或 '3,5,8'"""
+    ids = []
+    for part in text.split(','):
+        start, _, end = part.partition('-')
+        ids.extend(range(int(start), int(end or start) + 1))
+    return ids
+
+
+def discover_match_ids(options):
+    """用第一个虚拟用户的身份从列表接口取可见赛事的ID"""
+    user = VirtualUser(0, options, Stats(), [], 0)
+    if not user.login():
+        raise SystemExit(f"❌ 无法登录 {options.url}，请检查 --phone-format/--password 与数据库中的球员")
+    ids, cursor = [], None
+    for _ in range(5):
+        path = '/matches/api/matches?limit=100&fields=id' + (f'&cursor={urllib.parse.quote(cursor)}' if cursor else '')
+        status, text = user.request('discover', path, record=False)
+        if status != 200:
+            break
+        page = json.loads(text)
+        ids.extend(item['id'] for item in page['items'])
+        cursor = page.get('next_cursor')
+        if not cursor:
+            break
+    return ids
+
+
+def report(stats, elapsed):
+    """打印每个接口的吞吐量和延迟分布，返回汇总数据"""
+    rows = []
+    all_latencies = []
+    for name in sorted(stats.latencies):
+        latencies = sorted(stats.latencies[name])
+        all_latencies.extend(latencies)
+        failures = sum(count for status, count in stats.statuses[name].items() if status >= 500)
+        failures += sum(stats.errors.get(name, {}).values())
+        rows.append({
+            'endpoint': name,
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed,
+            'failures': failures,
+            'statuses': stats.statuses[name],
+            **{f'p{p}_ms': percentile(latencies, p) * 1000 for p in PERCENTILES},
+            'max_ms': latencies[-1] * 1000,
+        })
+    for name in stats.errors:
+        if name not in stats.latencies:
+            rows.append({'endpoint': name, 'requests': 0, 'rps': 0.0,
+                         'failures': sum(stats.errors[name].values()), 'statuses': {},
+                         **{f'p{p}_ms': 0.0 for p in PERCENTILES}, 'max_ms': 0.0})
+
+    header = f"{'接口':<18}{'请求数':>8}{'req/s':>9}{'失败':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  状态码"
+    print(header)
+    print('-' * (len(header) + 12))
+    for row in rows:
+        statuses = ' '.join(f'{status}×{count}' for status, count in sorted(row['statuses'].items()))
+        print(f"{row['endpoint']:<20}{row['requests']:>8}{row['rps']:>9.1f}{row['failures']:>7}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}  {statuses}")
+
+    all_latencies.sort()
+    total = {
+        'requests': len(all_latencies),
+        'rps': len(all_latencies) / elapsed,
+        'failures': sum(row['failures'] for row in rows),
+        **{f'p{p}_ms': percentile(all_latencies, p) * 1000 for p in PERCENTILES},
+    }
+    print('-' * (len(header) + 12))
+    print(f"{'合计':<18}{total['requests']:>8}{total['rps']:>9.1f}{total['failures']:>7}"
+          f"{total['p50_ms']:>9.1f}{total['p95_ms']:>9.1f}{total['p99_ms']:>9.1f}")
+    for name, errors in stats.errors.items():
+        print(f"⚠️  {name}: " + ', '.join(f'{error}×{count}' for error, count in errors.items()))
+    return {'elapsed': elapsed, 'endpoints': rows, 'total': total}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='LaOpen 压测工具')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=50, help='并发虚拟用户数')
+    parser.add_argument('--duration', type=float, default=30, help='持续时间 (秒)')
+    parser.add_argument('--ramp-up', type=float, default=5, help='在多少秒内逐步启动全部虚拟用户')
+    parser.add_argument('--think-time', type=float, default=0.5, help='两次请求之间的平均间隔 (秒)')
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help=f"场景权重，可选：{', '.join(DEFAULT_MIX)}")
+    parser.add_argument('--first-user', type=int, default=1, help='第一个虚拟用户对应的球员序号')
+    parser.add_argument('--phone-format', default='13{:09d}', help='按序号生成手机号 (与 synthetic_data.py 一致)')
+    parser.add_argument('--password', default='password123')
+    parser.add_argument('--join-password', default='{:06d}', help='按赛事ID生成加入密码 (与 synthetic_data.py 一致)')
+    parser.add_argument('--match-ids', type=parse_match_ids, help="访问的赛事ID，如 '1-500'；默认从列表接口获取")
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='把结果另存为 JSON 文件')
+    options = parser.parse_args(argv)
+    options.url = options.url.rstrip('/')
+
+    match_ids = options.match_ids or discover_match_ids(options)
+    if not match_ids:
+        raise SystemExit('❌ 没有可访问的赛事，请用 --match-ids 指定')
+
+    print(f"🚀 {options.users} 个虚拟用户，持续 {options.duration:.0f}s，目标 {options.url}，"
+          f"{len(match_ids)} 个赛事")
+    stats = Stats()
+    started = time.monotonic()
+    stop_at = started + options.ramp_up + options.duration
+    users = [VirtualUser(index, options, stats, match_ids, stop_at) for index in range(options.users)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join(timeout=max(stop_at - time.monotonic(), 0) + options.timeout)
+    elapsed = time.monotonic() - started
+
+    logged_in = sum(1 for user in users if user.logged_in)
+    if logged_in < len(users):
+        print(f"⚠️  {len(users) - logged_in} 个虚拟用户登录失败 "
+              f"(429 为登录限流，请以 LOGIN_LIMITER_ENABLED=0 启动；503 为密码哈希队列已满)")
+    result = report(stats, elapsed)
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到 {options.json}")
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,16 @@ LaOpen 赛事管理模块
 处理赛事列表、赛事详情、用户加入赛事等功能
 """
 
+import base64
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime
-from models import db, Match, Game, User
+from sqlalchemy import select, func, literal, or_, and_, Integer, DateTime
+from sqlalchemy.exc import OperationalError
+from models import db, Match, Game, User, match_participants, participant_counts, rating_ranks, game_model_for
+from versioning import touch_matches, read_counter, make_etag, not_modified_response, with_etag, RATINGS_COUNTER
+from fragment_cache import fragment_cache
+from live_updates import live_broker
 
 # 创建赛事管理蓝图
 match_mgmt_bp = Blueprint('match_mgmt', __name__, url_prefix='/matches')
@@ -54,16 +60,61 @@ def match_detail(match_id):
     
     match = Match.query.get_or_404(match_id)
     
-    # 检查用户是否已参与
+    # 检查用户是否已参与 (每个用户不同，不缓存)
     is_participant = match.is_participant(current_user)
     
-    # 获取赛事中的所有比赛
-    games = Game.query.filter_by(match_id=match_id).order_by(
-        Game.round_number.asc(),
-        Game.scheduled_time.asc()
+    # 参与者列表和比赛列表按赛事版本号缓存；积分/排名变化时参与者列表也需重新渲染
+    ratings_version = read_counter(db.session, RATINGS_COUNTER)
+    participants_html = fragment_cache.get_or_render(
+        match.id, 'participants', (match.change_version, ratings_version),
+        lambda: render_template('matches/_participants.html',
+                                match=match,
+                                participants=match.participants,
+                                ranks=rating_ranks(p.rating for p in match.participants)))
+    schedule_html = fragment_cache.get_or_render(
+        match.id, 'schedule', match.change_version,
+        lambda: render_template('matches/_schedule.html',
+                                games_by_round=_games_by_round(match)))
+    
+    return render_template('matches/match_detail.html',
+                         match=match,
+                         is_participant=is_participant,
+                         participants_html=participants_html,
+                         schedule_html=schedule_html)
+
+@match_mgmt_bp.route('/<int:match_id>/stream')
+@login_required
+def match_stream(match_id):
+    """赛事实时更新 (Server-Sent Events)，推送比赛状态和比分的增量"""
+    match = Match.query.get_or_404(match_id)
+    return live_broker.stream(match, request.headers.get('Last-Event-ID'))
+
+@match_mgmt_bp.route('/<int:match_id>/export.csv')
+@login_required
+def export_match_csv(match_id):
+    """导出赛事比赛列表 (CSV)"""
+    from exports import match_csv_lines, streaming_response
+    
+    match = Match.query.get_or_404(match_id)
+    return streaming_response(match_csv_lines(match), 'text/csv', f'match-{match.id}.csv')
+
+@match_mgmt_bp.route('/<int:match_id>/export.ics')
+@login_required
+def export_match_ics(match_id):
+    """导出赛事比赛列表 (iCalendar)"""
+    from exports import match_ics_lines, streaming_response
+    
+    match = Match.query.get_or_404(match_id)
+    return streaming_response(match_ics_lines(match), 'text/calendar', f'match-{match.id}.ics')
+
+def _games_by_round(match):
+    """获取赛事中的所有比赛并按轮次分组 (已归档的赛事从归档表读取)"""
+    model = game_model_for(match)
+    games = model.query.filter_by(match_id=match.id).order_by(
+        model.round_number.asc(),
+        model.scheduled_time.asc()
     ).all()
     
-    # 按轮次分组比赛
     games_by_round = {}
     for game in games:
         round_key = f"Round {game.round_number}"
@@ -74,11 +125,66 @@ def match_detail(match_id):
             games_by_round[round_key] = []
         games_by_round[round_key].append(game)
     
-    return render_template('matches/match_detail.html',
-                         match=match,
-                         is_participant=is_participant,
-                         games_by_round=games_by_round,
-                         participants=match.participants)
+    return games_by_round
+
+# 加入赛事的结果
+JOINED = 'joined'                   # 已加入
+JOINED_AND_FILLED = 'filled'        # 已加入，且赛事因此满员
+ALREADY_JOINED = 'already_joined'
+MATCH_FULL = 'full'
+REGISTRATION_CLOSED = 'closed'      # 不在报名中或已过报名截止时间
+
+def join_match_atomic(match_id, user_id):
+    """
+    在一个事务中用条件写入完成加入，返回上面的结果之一
+    先用条件 UPDATE 锁住赛事行 (只锁这一个赛事，同一赛事的并发加入在此排队)，
+    再用 INSERT ... SELECT 在人数未满且尚未加入时插入参与者，容量由数据库保证，不会超员
+    
+    版本号和 change_log 与参与者在同一事务中提交 (增量同步以 change_log 为准，不能只成功一半)；
+    推进全局版本号放在最后一步，尽量缩短持有该行锁的时间
+    """
+    matches = Match.__table__
+    participants = match_participants
+    now = datetime.utcnow()
+    count = (select(func.count()).select_from(participants)
+             .where(participants.c.match_id == match_id).scalar_subquery())
+    joined = select(participants.c.user_id).where(
+        participants.c.match_id == match_id, participants.c.user_id == user_id).exists()
+    
+    with db.engine.connect() as conn:
+        opened = conn.execute(matches.update().where(
+            matches.c.id == match_id, matches.c.status == 'registering',
+            or_(matches.c.registration_deadline.is_(None), matches.c.registration_deadline > now),
+        ).values(updated_at=now)).rowcount
+        if not opened:
+            # 报满后赛事已转为准备中，此时告诉用户"已满"而不是"未开放报名"
+            full = conn.execute(select(count >= matches.c.max_participants)
+                                .where(matches.c.id == match_id)).scalar()
+            conn.rollback()
+            return MATCH_FULL if full else REGISTRATION_CLOSED
+        
+        inserted = conn.execute(participants.insert().from_select(
+            ['match_id', 'user_id', 'joined_at'],
+            select(matches.c.id, literal(user_id, Integer), literal(now, DateTime))
+            .where(matches.c.id == match_id, count < matches.c.max_participants, ~joined),
+        )).rowcount
+        if not inserted:
+            result = ALREADY_JOINED if conn.execute(select(joined)).scalar() else MATCH_FULL
+            conn.rollback()
+            return result
+        
+        # 满员后自动转为准备中
+        filled = conn.execute(matches.update().where(
+            matches.c.id == match_id, count >= matches.c.max_participants,
+        ).values(status='preparing')).rowcount
+        
+        entries = [('participant', user_id, match_id)]
+        if filled:
+            entries.append(('match', match_id, match_id))
+        # 绕过了 ORM，手动推进赛事版本号 (页面缓存、ETag 和增量同步)
+        touch_matches(conn, [match_id], entries)
+        conn.commit()
+    return JOINED_AND_FILLED if filled else JOINED
 
 @match_mgmt_bp.route('/<int:match_id>/join', methods=['POST'])
 @login_required
@@ -88,12 +194,18 @@ def join_match(match_id):
     match = Match.query.get_or_404(match_id)
     password = request.form.get('password', '').strip()
     
-    # 验证加入条件
-    if match.is_participant(current_user):
+    # 先给出明确提示 (与密码错误相比，已加入/不可报名优先)；
+    # 这两项只是预检，最终以 join_match_atomic 在数据库中的判断为准
+    already_joined = db.session.execute(select(
+        select(match_participants.c.user_id).where(
+            match_participants.c.match_id == match_id,
+            match_participants.c.user_id == current_user.id).exists()
+    )).scalar()
+    if already_joined:
         flash('You have already joined this match!', 'info')
         return redirect(url_for('match_mgmt.match_detail', match_id=match_id))
     
-    if not match.can_register:
+    if not match.registration_open(participant_counts([match_id]).get(match_id, 0)):
         flash('Registration is not available for this match.', 'error')
         return redirect(url_for('match_mgmt.match_detail', match_id=match_id))
     
@@ -101,21 +213,26 @@ def join_match(match_id):
         flash('Incorrect password!', 'error')
         return redirect(url_for('match_mgmt.match_detail', match_id=match_id))
     
-    # 加入赛事
+    match_name = match.name
+    user_id = current_user.id
+    db.session.rollback()
     try:
-        match.participants.append(current_user)
-        db.session.commit()
-        flash(f'Successfully joined {match.name}!', 'success')
-        
-        # 如果赛事满员，自动更改状态
-        if match.is_full and match.status == 'registering':
-            match.status = 'preparing'
-            db.session.commit()
-            flash('Match is now full and ready to start!', 'info')
-            
-    except Exception as e:
-        db.session.rollback()
+        result = join_match_atomic(match_id, user_id)
+    except OperationalError:
+        # 锁等待超过 busy_timeout 等
         flash('Failed to join match. Please try again.', 'error')
+        return redirect(url_for('match_mgmt.match_detail', match_id=match_id))
+    
+    if result == ALREADY_JOINED:
+        flash('You have already joined this match!', 'info')
+    elif result == MATCH_FULL:
+        flash('This match is full.', 'error')
+    elif result == REGISTRATION_CLOSED:
+        flash('Registration is not available for this match.', 'error')
+    else:
+        flash(f'Successfully joined {match_name}!', 'success')
+        if result == JOINED_AND_FILLED:
+            flash('Match is now full and ready to start!', 'info')
     
     return redirect(url_for('match_mgmt.match_detail', match_id=match_id))
 
@@ -198,31 +315,103 @@ def create_match():
     return render_template('matches/create_match.html')
 
 # 用于JSON API的路由
+
+# 赛事列表接口可通过 fields= 选择的字段 (默认全部返回)
+MATCH_API_FIELDS = ('id', 'name', 'location', 'start_datetime', 'status', 'participants',
+                    'max_participants', 'match_type', 'is_participant', 'can_register')
+MATCH_API_DEFAULT_LIMIT = 20
+MATCH_API_MAX_LIMIT = 100
+
+def _encode_cursor(match):
+    """把 (start_datetime, id) 编码为不透明的分页游标"""
+    raw = f'{match.start_datetime.isoformat()}|{match.id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    """解析分页游标，格式错误时抛出 ValueError (binascii.Error/UnicodeError 均为其子类)"""
+    raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    start, match_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(start), int(match_id)
+
 @match_mgmt_bp.route('/api/matches')
 @login_required
 def api_matches():
-    """获取赛事列表的API接口"""
+    """
+    获取赛事列表的API接口
+    参数: limit (默认20，最大100)、cursor (上一页返回的 next_cursor)、fields (逗号分隔的字段名)
+    返回: {"items": [...], "next_cursor": "..." 或 null}
+    """
+    limit = min(max(request.args.get('limit', MATCH_API_DEFAULT_LIMIT, type=int), 1), MATCH_API_MAX_LIMIT)
     
-    matches = Match.query.filter(
-        Match.status.in_(['preparing', 'registering', 'ongoing'])
-    ).order_by(Match.start_datetime.asc()).all()
+    fields = MATCH_API_FIELDS
+    if request.args.get('fields'):
+        fields = tuple(field.strip() for field in request.args['fields'].split(',') if field.strip())
+        unknown = [field for field in fields if field not in MATCH_API_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}",
+                            'allowed': list(MATCH_API_FIELDS)}), 400
+    
+    cursor = request.args.get('cursor')
+    after = None
+    if cursor:
+        try:
+            after = _decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    # 任何赛事/比赛/参与者变化都会推进全局版本号；报名截止时间到期不涉及写入，单独计入
+    visible_statuses = ['preparing', 'registering', 'ongoing']
+    closed_count = Match.query.filter(
+        Match.status.in_(visible_statuses),
+        Match.registration_deadline < datetime.utcnow()
+    ).count()
+    etag = make_etag('matches', read_counter(db.session), current_user.id, closed_count,
+                     cursor, limit, ','.join(fields))
+    cached = not_modified_response(etag)
+    if cached is not None:
+        return cached
     
-    result = []
+    # 按 (start_datetime, id) 索引顺序读取一页，多取一条判断是否还有下一页
+    query = Match.query.filter(Match.status.in_(visible_statuses))
+    if after is not None:
+        start, match_id = after
+        query = query.filter(or_(
+            Match.start_datetime > start,
+            and_(Match.start_datetime == start, Match.id > match_id)
+        ))
+    matches = query.order_by(Match.start_datetime.asc(), Match.id.asc()).limit(limit + 1).all()
+    next_cursor = _encode_cursor(matches[limit - 1]) if len(matches) > limit else None
+    matches = matches[:limit]
+    
+    # 参与人数和当前用户是否参与：每页各一条查询，不加载参与者列表
+    match_ids = [match.id for match in matches]
+    counts = participant_counts(match_ids) if {'participants', 'can_register'} & set(fields) else {}
+    joined = set()
+    if 'is_participant' in fields and match_ids:
+        joined = set(db.session.execute(
+            select(match_participants.c.match_id).where(
+                match_participants.c.user_id == current_user.id,
+                match_participants.c.match_id.in_(match_ids))
+        ).scalars())
+    
+    items = []
     for match in matches:
-        result.append({
+        count = counts.get(match.id, 0)
+        row = {
             'id': match.id,
             'name': match.name,
             'location': match.location,
             'start_datetime': match.start_datetime.isoformat(),
             'status': match.status,
-            'participants': match.participant_count,
+            'participants': count,
             'max_participants': match.max_participants,
             'match_type': match.match_type,
-            'is_participant': match.is_participant(current_user),
-            'can_register': match.can_register
-        })
+            'is_participant': match.id in joined,
+            'can_register': 'can_register' in fields and match.registration_open(count),
+        }
+        items.append({field: row[field] for field in fields})
     
-    return jsonify(result)
+    return with_etag(jsonify({'items': items, 'next_cursor': next_cursor}), etag)
 
 @match_mgmt_bp.route('/api/matches/<int:match_id>')
 @login_required
@@ -231,7 +420,14 @@ def api_match_detail(match_id):
     
     match = Match.query.get_or_404(match_id)
     
-    return jsonify({
+    # 只读取赛事行：版本号未变时直接返回304，不加载参与者和比赛
+    deadline_passed = bool(match.registration_deadline and datetime.utcnow() > match.registration_deadline)
+    etag = make_etag('match', match.id, match.change_version, current_user.id, deadline_passed)
+    cached = not_modified_response(etag)
+    if cached is not None:
+        return cached
+    
+    return with_etag(jsonify({
         'id': match.id,
         'name': match.name,
         'description': match.description,
@@ -244,5 +440,49 @@ def api_match_detail(match_id):
         'tournament_type': match.tournament_type,
         'is_participant': match.is_participant(current_user),
         'can_register': match.can_register,
-        'games_count': len(match.games)
-    })
+        'games_count': match.game_count,
+        'change_version': match.change_version
+    }), etag)
+
+@match_mgmt_bp.route('/api/changes')
+@login_required
+def api_changes():
+    """
+    增量同步接口
+    参数: since=<上次响应中的version> 或 since_time=<ISO时间>；都不带时返回全量快照
+    """
+    from delta_sync import changes_since
+    
+    since = request.args.get('since', type=int)
+    since_time = request.args.get('since_time')
+    if since_time:
+        try:
+            since_time = datetime.fromisoformat(since_time)
+        except ValueError:
+            return jsonify({'error': 'Invalid since_time'}), 400
+    
+    return jsonify(changes_since(since, since_time or None))
+
+@match_mgmt_bp.route('/api/games/results', methods=['POST'])
+@login_required
+def api_submit_results():
+    """
+    批量录入比分的API接口
+    请求体: {"results": [{"game_id": 1, "version": 1, "sets": [[6, 4], [6, 3]]}, ...]}
+    所有比赛在一个事务中提交；任何一场版本冲突则整批回滚并返回409
+    """
+    from scoring import record_results, game_result_payload, ScoreEntryError
+    
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Request body must be a JSON object', 'games': []}), 400
+    
+    try:
+        games, _ = record_results(payload.get('results'), current_user)
+    except ScoreEntryError as e:
+        return jsonify({'error': e.message, 'games': e.details}), e.status_code
+    
+    # 本进程的订阅者立即收到推送，其他 worker 在下一次轮询时收到
+    live_broker.notify()
+    
+    return jsonify({'results': [game_result_payload(game) for game in games]})
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 性能监控模块
+按端点记录请求耗时、SQL 次数/耗时、模板渲染耗时和响应大小，
+通过 /metrics 以 Prometheus 文本格式输出，并记录慢请求和慢查询
+生产环境需设置 METRICS_TOKEN，抓取时带 Authorization: Bearer <令牌>；未设置时该端点返回 404
+
+多进程部署 (gunicorn) 时设置 METRICS_DIR，每个 worker 定期把自己的数据写入
+该目录，/metrics 汇总所有 worker 的数据
+"""
+
+import json
+import os
+import threading
+import time
+from flask import g, request, has_request_context, Response, before_render_template, template_rendered
+from sqlalchemy import event
+
+# 直方图分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+# 多进程模式下每个 worker 写快照的最小间隔 (秒)
+SNAPSHOT_INTERVAL = 5.0
+
+
+class MetricsRegistry:
+    """进程内的计数器和直方图，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}    # {(name, labels): value}
+        self.histograms = {}  # {(name, labels): {'buckets': [...], 'counts': [...], 'sum': x, 'count': n}}
+        self.help = {}        # {name: (type, help)}
+        self._last_snapshot = 0.0
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, metric_type, help_text):
+        self.help[name] = (metric_type, help_text)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+                self.histograms[key] = histogram
+            for index, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self) -> dict:
+        """导出为可 JSON 序列化的快照"""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), dict(histogram, counts=list(histogram['counts']))]
+                               for (name, labels), histogram in self.histograms.items()],
+            }
+
+    def dump_snapshot(self, directory, force=False):
+        """多进程模式：把本进程的快照写入 METRICS_DIR/<pid>.json"""
+        now = time.monotonic()
+        if not force and now - self._last_snapshot < SNAPSHOT_INTERVAL:
+            return
+        self._last_snapshot = now
+        # 目录可能被部署脚本或 gunicorn 启动钩子清理过
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def render(self, snapshots=None) -> str:
+        """输出 Prometheus 文本格式；snapshots 为其他进程的快照列表"""
+        counters = {}
+        histograms = {}
+        for snapshot in (snapshots if snapshots is not None else [self.snapshot()]):
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, histogram in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = dict(histogram, counts=list(histogram['counts']))
+                else:
+                    merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+                    merged['sum'] += histogram['sum']
+                    merged['count'] += histogram['count']
+
+        lines = []
+        described = set()
+
+        def header(name, default_type):
+            if name in described:
+                return
+            described.add(name)
+            metric_type, help_text = self.help.get(name, (default_type, name))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", _format_value(bound)),))} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {histogram["count"]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram["sum"])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+# 进程级单例
+registry = MetricsRegistry()
+registry.describe('laopen_request_duration_seconds', 'histogram', 'Request latency by endpoint')
+registry.describe('laopen_request_sql_statements', 'histogram', 'SQL statements executed per request')
+registry.describe('laopen_request_sql_seconds', 'histogram', 'Time spent in SQL per request')
+registry.describe('laopen_request_template_seconds', 'histogram', 'Template render time per request')
+registry.describe('laopen_response_size_bytes', 'histogram', 'Response body size by endpoint')
+registry.describe('laopen_slow_requests_total', 'counter', 'Requests slower than SLOW_REQUEST_MS')
+registry.describe('laopen_slow_queries_total', 'counter', 'SQL statements slower than SLOW_QUERY_MS')
+
+
+def _endpoint_label():
+    return request.endpoint or 'unmatched'
+
+
+def _register_sql_events(app, db):
+    """通过 SQLAlchemy 引擎事件统计 SQL 次数和耗时"""
+    slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000.0
+    logger = app.logger
+
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('laopen_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('laopen_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+
+        if has_request_context() and 'metrics_start' in g:
+            g.metrics_sql_count += 1
+            g.metrics_sql_time += elapsed
+
+        if elapsed >= slow_query_seconds:
+            endpoint = _endpoint_label() if has_request_context() else 'none'
+            registry.inc('laopen_slow_queries_total', endpoint=endpoint)
+            logger.warning('慢查询 %.1fms [%s]: %s', elapsed * 1000, endpoint, ' '.join(statement.split())[:300])
+
+    # 主库和只读副本 (如果配置了) 都统计
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _register_template_signals(app):
+    """统计模板渲染耗时"""
+
+    def _before_render(sender, template, context, **extra):
+        if 'metrics_start' in g:
+            g.metrics_template_start = time.perf_counter()
+
+    def _rendered(sender, template, context, **extra):
+        start = g.pop('metrics_template_start', None)
+        if start is not None:
+            g.metrics_template_time += time.perf_counter() - start
+
+    before_render_template.connect(_before_render, app, weak=False)
+    template_rendered.connect(_rendered, app, weak=False)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _snapshot_pids(directory):
+    """{pid: [文件名]}，包括写了一半的 .tmp 文件"""
+    try:
+        filenames = os.listdir(directory)
+    except OSError:
+        return {}
+    pids = {}
+    for filename in filenames:
+        name = filename.split('.', 1)[0]
+        if name.isdigit():
+            pids.setdefault(int(name), []).append(filename)
+    return pids
+
+
+def remove_snapshots(directory, pids=None):
+    """删除指定 worker (默认全部) 的快照文件，保留目录本身"""
+    for pid, filenames in _snapshot_pids(directory).items():
+        if pids is not None and pid not in pids:
+            continue
+        for filename in filenames:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+
+
+def prune_dead_snapshots(directory):
+    """删除已退出的 worker 留下的快照 (gunicorn 之外的部署方式没有 child_exit 钩子)"""
+    dead = [pid for pid in _snapshot_pids(directory) if not _pid_alive(pid)]
+    if dead:
+        remove_snapshots(directory, dead)
+
+
+def _load_snapshots(directory):
+    snapshots = []
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def init_metrics(app, db):
+    """为应用注册性能监控中间件和 /metrics 端点"""
+    app.config.setdefault('METRICS_ENABLED', os.environ.get('METRICS_ENABLED', '1') == '1')
+    app.config.setdefault('SLOW_REQUEST_MS', int(os.environ.get('SLOW_REQUEST_MS', 500)))
+    app.config.setdefault('SLOW_QUERY_MS', int(os.environ.get('SLOW_QUERY_MS', 100)))
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+    app.config.setdefault('METRICS_DIR', os.environ.get('METRICS_DIR'))
+
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    metrics_dir = app.config['METRICS_DIR']
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    slow_request_seconds = app.config['SLOW_REQUEST_MS'] / 1000.0
+    production = os.environ.get('FLASK_ENV') == 'production'
+
+    _register_sql_events(app, db)
+    _register_template_signals(app)
+
+    @app.before_request
+    def _metrics_before_request():
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_time = 0.0
+        g.metrics_template_time = 0.0
+
+    @app.after_request
+    def _metrics_after_request(response):
+        start = g.get('metrics_start')
+        if start is None or request.endpoint == 'metrics':
+            return response
+
+        elapsed = time.perf_counter() - start
+        endpoint = _endpoint_label()
+        labels = {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)}
+
+        registry.observe('laopen_request_duration_seconds', elapsed, LATENCY_BUCKETS, **labels)
+        registry.observe('laopen_request_sql_statements', g.metrics_sql_count, SQL_COUNT_BUCKETS, endpoint=endpoint)
+        registry.observe('laopen_request_sql_seconds', g.metrics_sql_time, LATENCY_BUCKETS, endpoint=endpoint)
+        registry.observe('laopen_request_template_seconds', g.metrics_template_time, LATENCY_BUCKETS,
+                         endpoint=endpoint)
+        if response.content_length is not None:
+            registry.observe('laopen_response_size_bytes', response.content_length, SIZE_BUCKETS, endpoint=endpoint)
+
+        if elapsed >= slow_request_seconds:
+            registry.inc('laopen_slow_requests_total', endpoint=endpoint)
+            app.logger.warning('慢请求 %.1fms %s %s (SQL %d次/%.1fms，模板 %.1fms)',
+                               elapsed * 1000, request.method, request.path,
+                               g.metrics_sql_count, g.metrics_sql_time * 1000,
+                               g.metrics_template_time * 1000)
+
+        if metrics_dir:
+            _dump_snapshot()
+
+        return response
+
+    def _dump_snapshot(force=False):
+        # 监控数据写不进去也不能让用户请求失败
+        try:
+            registry.dump_snapshot(metrics_dir, force=force)
+        except OSError as e:
+            app.logger.warning('监控快照写入失败 (%s): %s', metrics_dir, e)
+
+    def metrics():
+        """Prometheus 抓取端点"""
+        token = app.config['METRICS_TOKEN']
+        if not token and production:
+            # 生产环境未配置令牌时不公开端点列表、延迟分布和连接池状态
+            return Response('not found\n', status=404, mimetype='text/plain')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('forbidden\n', status=403, mimetype='text/plain')
+
+        if metrics_dir:
+            _dump_snapshot(force=True)
+            prune_dead_snapshots(metrics_dir)
+            body = registry.render(_load_snapshots(metrics_dir))
+        else:
+            body = registry.render()
+        return Response(body, mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
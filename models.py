@@ -7,11 +7,18 @@ LaOpen 数据库模型
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+import time
 from datetime import datetime
-import bcrypt
+from passwords import hash_password, verify_password, needs_rehash
+from read_replica import RoutingSession
 
 # 数据库实例
-db = SQLAlchemy()
+# 只读请求的查询可路由到副本 (DATABASE_READ_URL)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# 数据库结构版本：模型新增表/列/索引时 +1，启动时版本戳不一致才会执行建表和补列
+SCHEMA_VERSION = 2
+SCHEMA_VERSION_COUNTER = 'schema_version'
 
 class User(UserMixin, db.Model):
     """网球球员模型"""
@@ -33,16 +40,17 @@ class User(UserMixin, db.Model):
     last_played = db.Column(db.DateTime, nullable=True)        # 最后比赛时间
     
     def set_password(self, password):
-        """设置密码哈希"""
-        password_bytes = password.encode('utf-8')
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password_bytes, salt).decode('utf-8')
+        """设置密码哈希 (工作因子见 passwords.py)"""
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """验证密码"""
-        password_bytes = password.encode('utf-8')
-        hash_bytes = self.password_hash.encode('utf-8')
-        return bcrypt.checkpw(password_bytes, hash_bytes)
+        return verify_password(password, self.password_hash)
+    
+    @property
+    def password_needs_rehash(self):
+        """存储的哈希工作因子与当前配置不同"""
+        return needs_rehash(self.password_hash)
     
     @property
     def win_rate(self):
@@ -67,6 +75,42 @@ match_participants = db.Table('match_participants',
     db.Column('joined_at', db.DateTime, default=datetime.utcnow)
 )
 
+# 按用户查找参与的赛事 (个人日历订阅等)；主键 (match_id, user_id) 无法用于按用户查询
+db.Index('ix_match_participants_user', match_participants.c.user_id)
+
+def participant_counts(match_ids):
+    """一条 GROUP BY 查询得到各赛事的参与人数 {match_id: count}"""
+    if not match_ids:
+        return {}
+    rows = db.session.execute(
+        db.select(match_participants.c.match_id, db.func.count())
+        .where(match_participants.c.match_id.in_(match_ids))
+        .group_by(match_participants.c.match_id)
+    ).all()
+    return dict(rows)
+
+def rating_ranks(ratings):
+    """
+    一次查询得到多个积分对应的排名 {rating: rank} (与 User.current_rank 相同：更高积分人数 + 1)
+    参与者列表等逐行显示排名时使用，避免每人一条 COUNT 查询
+    """
+    ratings = {rating for rating in ratings if rating is not None}
+    if not ratings:
+        return {}
+    rows = db.session.execute(
+        db.select(User.rating, db.func.count())
+        .where(User.rating > min(ratings))
+        .group_by(User.rating)
+        .order_by(User.rating.desc())
+    ).all()
+    ranks, higher, index = {}, 0, 0
+    for rating in sorted(ratings, reverse=True):
+        while index < len(rows) and rows[index][0] > rating:
+            higher += rows[index][1]
+            index += 1
+        ranks[rating] = higher + 1
+    return ranks
+
 class Match(db.Model):
     """赛事模型 - 一个赛事包含多场比赛"""
     __tablename__ = 'matches'
@@ -100,12 +144,23 @@ class Match(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # 变更版本号：赛事本身、比赛或参与者每次变化时更新为最新的全局版本号 (见 versioning.py)
+    change_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # 归档时间：不为空时该赛事的比赛已移到 games_archive (见 archive.py)，赛事行本身保留
+    archived_at = db.Column(db.DateTime, nullable=True)
+    
     # 关系
     creator = db.relationship('User', foreign_keys=[created_by], backref='created_matches')
     participants = db.relationship('User', secondary=match_participants, 
                                  backref=db.backref('joined_matches', lazy='dynamic'))
     games = db.relationship('Game', backref='match', lazy=True, cascade='all, delete-orphan')
     
+    # 赛事列表接口按 (start_datetime, id) 游标分页
+    __table_args__ = (
+        db.Index('ix_matches_start_id', 'start_datetime', 'id'),
+    )
+    
     @property
     def participant_count(self):
         """获取当前参与人数"""
@@ -119,9 +174,13 @@ class Match(db.Model):
     @property
     def can_register(self):
         """检查是否可以报名"""
+        return self.registration_open(self.participant_count)
+    
+    def registration_open(self, participant_count):
+        """按给定的参与人数判断是否可以报名 (列表接口批量统计人数时使用，避免加载参与者)"""
         if self.status != 'registering':
             return False
-        if self.is_full:
+        if participant_count >= self.max_participants:
             return False
         if self.registration_deadline and datetime.utcnow() > self.registration_deadline:
             return False
@@ -147,6 +206,14 @@ class Match(db.Model):
             self.court_list = None
             self.court_count = 1
     
+    @property
+    def game_count(self):
+        """比赛场数 (已归档的赛事从归档表统计)，不加载比赛"""
+        model = game_model_for(self)
+        return db.session.execute(
+            db.select(db.func.count()).select_from(model).where(model.match_id == self.id)
+        ).scalar()
+    
     def is_participant(self, user):
         """检查用户是否已参与"""
         return user in self.participants
@@ -154,52 +221,8 @@ class Match(db.Model):
     def __repr__(self):
         return f'<Match {self.name} ({self.participant_count}/{self.max_participants})>'
 
-class Game(db.Model):
-    """比赛模型 - 一场具体的比赛"""
-    __tablename__ = 'games'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    match_id = db.Column(db.Integer, db.ForeignKey('matches.id'), nullable=False)
-    
-    # 比赛信息
-    game_type = db.Column(db.String(20), default='singles')       # singles/doubles
-    round_name = db.Column(db.String(50), nullable=True)          # 轮次名称 (如 "Quarter Final")
-    round_number = db.Column(db.Integer, default=1)               # 轮次序号
-    
-    # 参赛选手 (最多4人，单打用前2个，双打用全部4个)
-    player1_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    player2_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # 双打时player1的队友
-    player3_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    player4_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # 双打时player3的队友
-    
-    # 比赛时间和场地
-    scheduled_time = db.Column(db.DateTime, nullable=True)        # 预定时间
-    actual_start_time = db.Column(db.DateTime, nullable=True)     # 实际开始时间
-    actual_end_time = db.Column(db.DateTime, nullable=True)       # 实际结束时间
-    court = db.Column(db.String(50), nullable=True)              # 场地
-    
-    # 比赛状态和结果
-    status = db.Column(db.String(20), default='scheduled')       # scheduled/playing/finished/cancelled
-    winner_team = db.Column(db.Integer, default=0)               # 获胜队伍 (1或3，分别代表player1/2队或player3/4队)
-    
-    # 比分信息 (支持多盘制)
-    set1_team1_score = db.Column(db.Integer, default=0)
-    set1_team2_score = db.Column(db.Integer, default=0)
-    set2_team1_score = db.Column(db.Integer, default=0)
-    set2_team2_score = db.Column(db.Integer, default=0)
-    set3_team1_score = db.Column(db.Integer, default=0)
-    set3_team2_score = db.Column(db.Integer, default=0)
-    
-    # 额外信息
-    notes = db.Column(db.Text, nullable=True)                    # 比赛备注
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    # 关系
-    player1 = db.relationship('User', foreign_keys=[player1_id])
-    player2 = db.relationship('User', foreign_keys=[player2_id])
-    player3 = db.relationship('User', foreign_keys=[player3_id])
-    player4 = db.relationship('User', foreign_keys=[player4_id])
+class GameResultMixin:
+    """比赛和归档比赛共用的只读属性 (模板、导出和接口对两者一视同仁)"""
     
     @property
     def is_finished(self):
@@ -211,6 +234,17 @@ class Game(db.Model):
         """是否为双打"""
         return self.game_type == 'doubles'
     
+    @property
+    def player_ids(self):
+        """获取 (队伍1选手ID列表, 队伍2选手ID列表)，不触发选手加载"""
+        if self.is_doubles:
+            team1 = [pid for pid in (self.player1_id, self.player2_id) if pid]
+            team2 = [pid for pid in (self.player3_id, self.player4_id) if pid]
+        else:
+            team1 = [self.player1_id] if self.player1_id else []
+            team2 = [self.player3_id] if self.player3_id else []
+        return team1, team2
+    
     @property
     def team1_players(self):
         """获取队伍1的选手"""
@@ -271,14 +305,244 @@ class Game(db.Model):
         team2_names = " & ".join([p.nickname for p in self.team2_players])
         return f'<Game {team1_names} vs {team2_names}>'
 
+class Game(GameResultMixin, db.Model):
+    """比赛模型 - 一场具体的比赛"""
+    __tablename__ = 'games'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    match_id = db.Column(db.Integer, db.ForeignKey('matches.id'), nullable=False)
+    
+    # 比赛信息
+    game_type = db.Column(db.String(20), default='singles')       # singles/doubles
+    round_name = db.Column(db.String(50), nullable=True)          # 轮次名称 (如 "Quarter Final")
+    round_number = db.Column(db.Integer, default=1)               # 轮次序号
+    
+    # 参赛选手 (最多4人，单打用前2个，双打用全部4个)
+    player1_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    player2_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # 双打时player1的队友
+    player3_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    player4_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # 双打时player3的队友
+    
+    # 比赛时间和场地
+    scheduled_time = db.Column(db.DateTime, nullable=True)        # 预定时间
+    actual_start_time = db.Column(db.DateTime, nullable=True)     # 实际开始时间
+    actual_end_time = db.Column(db.DateTime, nullable=True)       # 实际结束时间
+    court = db.Column(db.String(50), nullable=True)              # 场地
+    
+    # 比赛状态和结果
+    status = db.Column(db.String(20), default='scheduled')       # scheduled/playing/finished/cancelled
+    winner_team = db.Column(db.Integer, default=0)               # 获胜队伍 (1或2，分别代表player1/2队或player3/4队)
+    
+    # 比分信息 (支持多盘制)
+    set1_team1_score = db.Column(db.Integer, default=0)
+    set1_team2_score = db.Column(db.Integer, default=0)
+    set2_team1_score = db.Column(db.Integer, default=0)
+    set2_team2_score = db.Column(db.Integer, default=0)
+    set3_team1_score = db.Column(db.Integer, default=0)
+    set3_team2_score = db.Column(db.Integer, default=0)
+    
+    # 积分变化 (本场比赛给队伍1带来的ELO变化，队伍2为相反数；修改比分时用于回滚)
+    rating_delta = db.Column(db.Integer, default=0, server_default='0')
+    
+    # 乐观并发控制版本号 (每次更新自动+1，过期的写入会失败而不是覆盖)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    # 额外信息
+    notes = db.Column(db.Text, nullable=True)                    # 比赛备注
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __mapper_args__ = {'version_id_col': version}
+    
+    # 关系
+    player1 = db.relationship('User', foreign_keys=[player1_id])
+    player2 = db.relationship('User', foreign_keys=[player2_id])
+    player3 = db.relationship('User', foreign_keys=[player3_id])
+    player4 = db.relationship('User', foreign_keys=[player4_id])
+
+class ArchivedGame(GameResultMixin, db.Model):
+    """
+    归档比赛 - 已结束较久的赛事的比赛从 games 移到这里 (见 archive.py)
+    只读：去掉了录入过程中才用到的列，只保留按赛事查询的索引
+    """
+    __tablename__ = 'games_archive'
+    
+    # 沿用原比赛ID，导出/日历中的 UID 保持不变
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    match_id = db.Column(db.Integer, db.ForeignKey('matches.id'), nullable=False, index=True)
+    
+    game_type = db.Column(db.String(20), default='singles')
+    round_name = db.Column(db.String(50), nullable=True)
+    round_number = db.Column(db.Integer, default=1)
+    
+    player1_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    player2_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    player3_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    player4_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    
+    scheduled_time = db.Column(db.DateTime, nullable=True)
+    actual_end_time = db.Column(db.DateTime, nullable=True)
+    court = db.Column(db.String(50), nullable=True)
+    
+    status = db.Column(db.String(20), default='finished')
+    winner_team = db.Column(db.Integer, default=0)
+    
+    set1_team1_score = db.Column(db.SmallInteger, default=0)
+    set1_team2_score = db.Column(db.SmallInteger, default=0)
+    set2_team1_score = db.Column(db.SmallInteger, default=0)
+    set2_team2_score = db.Column(db.SmallInteger, default=0)
+    set3_team1_score = db.Column(db.SmallInteger, default=0)
+    set3_team2_score = db.Column(db.SmallInteger, default=0)
+    
+    rating_delta = db.Column(db.Integer, default=0)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    notes = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    
+    player1 = db.relationship('User', foreign_keys=[player1_id])
+    player2 = db.relationship('User', foreign_keys=[player2_id])
+    player3 = db.relationship('User', foreign_keys=[player3_id])
+    player4 = db.relationship('User', foreign_keys=[player4_id])
+
+def game_model_for(match):
+    """赛事的比赛所在的表：已归档的赛事为 ArchivedGame，否则为 Game"""
+    return ArchivedGame if match.archived_at else Game
+
+def games_of_matches(match_ids):
+    """多个赛事 (可能部分已归档) 的全部比赛，按ID排序"""
+    match_ids = list(match_ids)
+    if not match_ids:
+        return []
+    games = Game.query.filter(Game.match_id.in_(match_ids)).all()
+    games += ArchivedGame.query.filter(ArchivedGame.match_id.in_(match_ids)).all()
+    return sorted(games, key=lambda game: game.id)
+
+class ChangeCounter(db.Model):
+    """全局计数器 (如 'global' 变更版本号)，由 versioning.py 在写事务中原子自增"""
+    __tablename__ = 'change_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ChangeCounter {self.name}={self.value}>'
+
+class ChangeLog(db.Model):
+    """
+    变更日志 - 每个全局版本号下变化了哪些赛事、比赛和参与者 (由 versioning.py 写入)
+    客户端按版本号游标增量同步 (见 delta_sync.py)，旧记录定期清理
+    entity: match / game / participant (entity_id 为用户ID) / match_all (整个赛事需重新同步)
+    """
+    __tablename__ = 'change_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, index=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    match_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ChangeLog v{self.version} {self.entity}:{self.entity_id}>'
+
+class PlayerPairStat(db.Model):
+    """
+    选手两两统计 - 作为搭档/对手的场次和胜场
+    每对选手按 (user_id, other_id) 双向各存一行，查询某人的数据只需按主键前缀查找
+    由比分录入增量维护，可通过 pair_stats.rebuild_pair_stats() 全量重建
+    """
+    __tablename__ = 'player_pair_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    other_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    
+    partner_games = db.Column(db.Integer, nullable=False, default=0, server_default='0')    # 作为搭档的场次
+    partner_wins = db.Column(db.Integer, nullable=False, default=0, server_default='0')     # 作为搭档的胜场
+    opponent_games = db.Column(db.Integer, nullable=False, default=0, server_default='0')   # 作为对手的场次
+    opponent_wins = db.Column(db.Integer, nullable=False, default=0, server_default='0')    # user 战胜 other 的场次
+    opponent_losses = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # user 输给 other 的场次
+    
+    __table_args__ = (
+        db.Index('ix_player_pair_stats_partner', 'user_id', 'partner_games'),
+        db.Index('ix_player_pair_stats_nemesis', 'user_id', 'opponent_losses'),
+    )
+    
+    other = db.relationship('User', foreign_keys=[other_id])
+    
+    def __repr__(self):
+        return f'<PlayerPairStat {self.user_id}->{self.other_id}>'
+
+def upgrade_columns():
+    """
+    为已存在的表补充模型中新增的列和索引
+    db.create_all() 只会创建缺失的表，不会修改已有表结构
+    """
+    inspector = db.inspect(db.engine)
+    added = []
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                if column.server_default is not None:
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                conn.execute(db.text(ddl))
+                added.append(f'{table.name}.{column.name}')
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+                    added.append(f'{table.name}.{index.name}')
+    return added
+
+def read_schema_version():
+    """读取数据库中的结构版本戳，表不存在或未写入时返回 None"""
+    try:
+        return db.session.execute(
+            db.select(ChangeCounter.value).where(ChangeCounter.name == SCHEMA_VERSION_COUNTER)
+        ).scalar()
+    except Exception:
+        # 全新数据库还没有 change_counters 表
+        db.session.rollback()
+        return None
+
+def write_schema_version():
+    counter = db.session.get(ChangeCounter, SCHEMA_VERSION_COUNTER)
+    if counter is None:
+        db.session.add(ChangeCounter(name=SCHEMA_VERSION_COUNTER, value=SCHEMA_VERSION))
+    else:
+        counter.value = SCHEMA_VERSION
+    db.session.commit()
+
 def init_db(app):
-    """初始化数据库表"""
+    """
+    初始化数据库表
+    版本戳与 SCHEMA_VERSION 一致时只做一次单行查询，跳过 create_all 和表结构反射；
+    否则建表、补列/索引后写入新的版本戳
+    """
     with app.app_context():
+        started = time.perf_counter()
         try:
+            stamped = read_schema_version()
+            if stamped == SCHEMA_VERSION:
+                print(f"✅ 数据库结构已是最新 (v{SCHEMA_VERSION})，"
+                      f"检查耗时 {(time.perf_counter() - started) * 1000:.1f}ms")
+                return True
+
             db.create_all()
-            print("✅ 数据库表创建成功！")
+            for column_name in upgrade_columns():
+                print(f"🔧 新增数据库列/索引：{column_name}")
+            write_schema_version()
+            print(f"✅ 数据库表创建成功！(结构版本 {stamped or '-'} → v{SCHEMA_VERSION}，"
+                  f"耗时 {(time.perf_counter() - started) * 1000:.1f}ms)")
             return True
         except Exception as e:
+            db.session.rollback()
             print(f"❌ 数据库初始化失败：{e}")
             print("请检查数据库配置")
             return False
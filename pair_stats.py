@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 选手两两统计模块
+维护搭档/对手矩阵 (player_pair_stats)，提供交手记录、最佳搭档和克星查询
+"""
+
+from collections import defaultdict
+from typing import Dict, List
+from sqlalchemy import bindparam, select, union_all
+from models import db, Game, ArchivedGame, PlayerPairStat
+
+STAT_FIELDS = ('partner_games', 'partner_wins', 'opponent_games', 'opponent_wins', 'opponent_losses')
+
+# 重建时每批处理的比赛数
+REBUILD_BATCH_SIZE = 1000
+
+
+class PairStatsDelta:
+    """一批比赛对两两统计的增量，最后一次性写入"""
+
+    def __init__(self):
+        self.rows = defaultdict(lambda: dict.fromkeys(STAT_FIELDS, 0))  # {(user_id, other_id): {field: delta}}
+
+    def add_game(self, team1_ids: List[int], team2_ids: List[int], winner_team: int, sign: int = 1):
+        """计入 (sign=1) 或撤销 (sign=-1) 一场已结束比赛"""
+        for team_ids, won in ((team1_ids, winner_team == 1), (team2_ids, winner_team == 2)):
+            opponent_ids = team2_ids if team_ids is team1_ids else team1_ids
+            for user_id in team_ids:
+                for partner_id in team_ids:
+                    if partner_id == user_id:
+                        continue
+                    row = self.rows[(user_id, partner_id)]
+                    row['partner_games'] += sign
+                    row['partner_wins'] += sign * won
+                for opponent_id in opponent_ids:
+                    row = self.rows[(user_id, opponent_id)]
+                    row['opponent_games'] += sign
+                    row['opponent_wins'] += sign * won
+                    row['opponent_losses'] += sign * (not won)
+
+    def flush(self):
+        """将增量写入数据库 (调用方负责提交事务)"""
+        rows = [
+            dict(user_id=user_id, other_id=other_id, **fields)
+            for (user_id, other_id), fields in self.rows.items()
+            if any(fields.values())
+        ]
+        if rows:
+            upsert_pair_stats(rows)
+        self.rows.clear()
+        return len(rows)
+
+
+def _dialect_insert(dialect_name):
+    """返回支持 ON CONFLICT 的 insert 构造函数，不支持时返回 None"""
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    return None
+
+
+def upsert_pair_stats(rows: List[dict]):
+    """
+    按增量累加两两统计
+    SQLite/PostgreSQL 使用 INSERT ... ON CONFLICT DO UPDATE 单语句完成，
+    其他数据库先更新已有行再插入新行
+    """
+    table = PlayerPairStat.__table__
+    insert = _dialect_insert(db.session.get_bind().dialect.name)
+
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.other_id],
+            set_={field: table.c[field] + stmt.excluded[field] for field in STAT_FIELDS},
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    user_ids = {row['user_id'] for row in rows}
+    existing = set(
+        db.session.query(PlayerPairStat.user_id, PlayerPairStat.other_id)
+        .filter(PlayerPairStat.user_id.in_(user_ids))
+        .all()
+    )
+    updates = [row for row in rows if (row['user_id'], row['other_id']) in existing]
+    inserts = [row for row in rows if (row['user_id'], row['other_id']) not in existing]
+    if updates:
+        db.session.execute(
+            table.update()
+            .where(table.c.user_id == bindparam('b_user_id'))
+            .where(table.c.other_id == bindparam('b_other_id'))
+            .values({field: table.c[field] + bindparam(f'b_{field}') for field in STAT_FIELDS}),
+            [{f'b_{key}': value for key, value in row.items()} for row in updates],
+        )
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+
+def rebuild_pair_stats() -> int:
+    """根据所有已结束比赛 (含归档表) 全量重建两两统计，返回处理的比赛数"""
+    db.session.query(PlayerPairStat).delete()
+
+    delta = PairStatsDelta()
+    processed = 0
+    query = union_all(*[
+        select(model.game_type, model.winner_team,
+               model.player1_id, model.player2_id, model.player3_id, model.player4_id)
+        .where(model.status == 'finished', model.winner_team.in_([1, 2]))
+        for model in (Game, ArchivedGame)
+    ])
+    rows = db.session.execute(query.execution_options(yield_per=REBUILD_BATCH_SIZE))
+    for game_type, winner_team, player1_id, player2_id, player3_id, player4_id in rows:
+        if game_type == 'doubles':
+            team1_ids = [pid for pid in (player1_id, player2_id) if pid]
+            team2_ids = [pid for pid in (player3_id, player4_id) if pid]
+        else:
+            team1_ids, team2_ids = [player1_id], [player3_id]
+        delta.add_game(team1_ids, team2_ids, winner_team)
+        processed += 1
+        if processed % REBUILD_BATCH_SIZE == 0:
+            delta.flush()
+
+    delta.flush()
+    db.session.commit()
+    return processed
+
+
+def _stat_payload(stat: PlayerPairStat) -> dict:
+    return {
+        'user_id': stat.other_id,
+        'nickname': stat.other.nickname,
+        'rating': stat.other.rating,
+        'partner_games': stat.partner_games,
+        'partner_wins': stat.partner_wins,
+        'opponent_games': stat.opponent_games,
+        'opponent_wins': stat.opponent_wins,
+        'opponent_losses': stat.opponent_losses,
+    }
+
+
+def head_to_head(user_id: int, other_id: int) -> Dict:
+    """两名选手之间的搭档和交手记录 (主键查找)"""
+    stat = db.session.get(PlayerPairStat, (user_id, other_id))
+    if stat is None:
+        return dict(user_id=user_id, other_id=other_id, **dict.fromkeys(STAT_FIELDS, 0))
+    return dict(user_id=user_id, other_id=other_id, **{field: getattr(stat, field) for field in STAT_FIELDS})
+
+
+def top_partners(user_id: int, limit: int = 10) -> List[dict]:
+    """搭档次数最多的选手 (走 user_id + partner_games 索引)"""
+    stats = (
+        PlayerPairStat.query
+        .options(db.joinedload(PlayerPairStat.other))
+        .filter(PlayerPairStat.user_id == user_id, PlayerPairStat.partner_games > 0)
+        .order_by(PlayerPairStat.partner_games.desc(), PlayerPairStat.partner_wins.desc())
+        .limit(limit)
+        .all()
+    )
+    return [_stat_payload(stat) for stat in stats]
+
+
+def nemesis_list(user_id: int, limit: int = 10) -> List[dict]:
+    """输得最多的对手 (走 user_id + opponent_losses 索引)"""
+    stats = (
+        PlayerPairStat.query
+        .options(db.joinedload(PlayerPairStat.other))
+        .filter(PlayerPairStat.user_id == user_id, PlayerPairStat.opponent_losses > 0)
+        .order_by(PlayerPairStat.opponent_losses.desc(), PlayerPairStat.opponent_wins.asc())
+        .limit(limit)
+        .all()
+    )
+    return [_stat_payload(stat) for stat in stats]
+
+
+if __name__ == '__main__':
+    import sys
+    from app import create_app
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print("用法: python3 pair_stats.py rebuild")
+        sys.exit(1)
+
+    app = create_app()
+    with app.app_context():
+        print("🔄 正在重建选手两两统计...")
+        count = rebuild_pair_stats()
+        print(f"✅ 重建完成，共处理 {count} 场比赛")
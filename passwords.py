@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 密码哈希
+- 启动时按目标耗时校准 bcrypt 工作因子 (也可用 BCRYPT_ROUNDS 固定)
+- 登录成功时若存储的哈希工作因子低于当前配置，自动重新哈希 (只升不降：单次校准受启动时负载影响，
+  按 != 比较会在繁忙时把用户哈希降级，并在各 worker/各次部署之间来回改写)
+- 哈希计算放到有界线程池中执行 (bcrypt 计算时释放 GIL)，并发数和排队数都有上限，
+  登录高峰时超出上限的请求直接返回"繁忙"，不会占满所有请求线程
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+
+# 工作因子范围
+MIN_ROUNDS = 10
+MAX_ROUNDS = 14
+DEFAULT_ROUNDS = 12
+
+# 默认目标单次哈希耗时 (毫秒)
+DEFAULT_TARGET_MS = 250
+
+# 校准时实际测量用的工作因子 (之后每 +1 耗时翻倍)
+CALIBRATION_ROUNDS = 8
+
+
+class HashingBusyError(Exception):
+    """哈希线程池排队已满，或排队等待超过 BCRYPT_TIMEOUT"""
+    pass
+
+
+class _HashingPool:
+    """有界的哈希线程池"""
+
+    def __init__(self):
+        self.rounds = None
+        self.max_workers = os.cpu_count() or 2
+        self.max_pending = self.max_workers * 4
+        self.timeout = 30.0
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def configure(self, rounds, max_workers, max_pending, timeout):
+        with self._lock:
+            self.rounds = rounds
+            self.max_workers = max_workers
+            self.max_pending = max_pending
+            self.timeout = timeout
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+            self._slots = None
+
+    def _ensure_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='bcrypt')
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+            return self._executor, self._slots
+
+    def run(self, fn, *args):
+        """在线程池中执行并等待结果；排队已满或等待超时时抛出 HashingBusyError"""
+        executor, slots = self._ensure_executor()
+        if not slots.acquire(blocking=False):
+            raise HashingBusyError('Password hashing queue is full')
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # 任务仍在池中，完成后自行释放排队名额
+            raise HashingBusyError('Password hashing timed out') from None
+
+
+_pool = _HashingPool()
+
+
+def _reset_after_fork():
+    """fork 出的子进程中线程池的线程不存在，需重新创建"""
+    _pool._lock = threading.Lock()
+    _pool._executor = None
+    _pool._slots = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def current_rounds() -> int:
+    return _pool.rounds or DEFAULT_ROUNDS
+
+
+def calibrate_rounds(target_ms: float = DEFAULT_TARGET_MS) -> int:
+    """选出单次哈希耗时不超过目标值的最大工作因子"""
+    salt = bcrypt.gensalt(rounds=CALIBRATION_ROUNDS)
+    start = time.perf_counter()
+    bcrypt.hashpw(b'calibration-password', salt)
+    measured_ms = max((time.perf_counter() - start) * 1000, 0.01)
+
+    rounds = CALIBRATION_ROUNDS
+    while rounds < MAX_ROUNDS and measured_ms * 2 ** (rounds + 1 - CALIBRATION_ROUNDS) <= target_ms:
+        rounds += 1
+    return max(rounds, MIN_ROUNDS)
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def _verify(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def hash_password(password: str, rounds: int = None) -> str:
+    """生成密码哈希 (在线程池中执行)"""
+    return _pool.run(_hash, password, rounds or current_rounds())
+
+
+def hash_password_inline(password: str, rounds: int = None) -> str:
+    """在当前线程/进程中直接计算哈希 (供批量导入的进程池调用)"""
+    return _hash(password, rounds or current_rounds())
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """验证密码 (在线程池中执行)"""
+    return _pool.run(_verify, password, password_hash)
+
+
+def hash_rounds(password_hash: str) -> int:
+    """从 $2b$12$... 格式的哈希中解析工作因子"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """存储的工作因子低于当前配置时需要重新哈希 (只升不降)"""
+    return hash_rounds(password_hash) < current_rounds()
+
+
+def init_passwords(app):
+    """读取配置并校准工作因子"""
+    app.config.setdefault('BCRYPT_ROUNDS', int(os.environ.get('BCRYPT_ROUNDS', 0)) or None)
+    app.config.setdefault('BCRYPT_TARGET_MS', float(os.environ.get('BCRYPT_TARGET_MS', DEFAULT_TARGET_MS)))
+    app.config.setdefault('BCRYPT_MAX_WORKERS', int(os.environ.get('BCRYPT_MAX_WORKERS', os.cpu_count() or 2)))
+    app.config.setdefault('BCRYPT_MAX_PENDING', int(os.environ.get('BCRYPT_MAX_PENDING',
+                                                                   app.config['BCRYPT_MAX_WORKERS'] * 4)))
+    app.config.setdefault('BCRYPT_TIMEOUT', float(os.environ.get('BCRYPT_TIMEOUT', 30)))
+
+    rounds = app.config['BCRYPT_ROUNDS']
+    if rounds:
+        source = '配置'
+    else:
+        rounds = calibrate_rounds(app.config['BCRYPT_TARGET_MS'])
+        source = f"按目标 {app.config['BCRYPT_TARGET_MS']:.0f}ms 校准"
+
+    _pool.configure(rounds, app.config['BCRYPT_MAX_WORKERS'], app.config['BCRYPT_MAX_PENDING'],
+                    app.config['BCRYPT_TIMEOUT'])
+    print(f"🔐 bcrypt 工作因子：{rounds} ({source})，哈希线程数：{app.config['BCRYPT_MAX_WORKERS']}")
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen SQL 查询预算和 N+1 检测 (开发/测试用)
+通过引擎事件统计每个请求执行的 SQL，请求结束时检查：
+- 超过 QUERY_BUDGETS 中为该端点声明的语句数
+- 同一形状的语句 (去掉参数值、IN 列表长度) 重复执行 N_PLUS_ONE_THRESHOLD 次以上，
+  通常是模板或循环里逐行触发的懒加载
+
+违规时记录语句和触发位置 (应用代码或模板的文件:行号)。开发环境默认开启并写日志；
+QUERY_BUDGET_STRICT=1 时直接抛出异常，用于 CI：
+
+    python3 query_budget.py    # 在临时数据库上请求所有已声明预算的端点，有违规时退出码为 1
+
+新增或修改页面后若语句数合理增加，同步调整 QUERY_BUDGETS
+"""
+
+import os
+import re
+import sys
+import threading
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# 每个端点允许的最大 SQL 语句数 (含登录用户加载、版本号读取等)
+QUERY_BUDGETS = {
+    'main.index': 4,
+    'tennis.dashboard': 6,
+    'tennis.api_head_to_head': 4,
+    'tennis.api_top_partners': 4,
+    'tennis.api_nemesis': 4,
+    'match_mgmt.match_list': 6,
+    'match_mgmt.match_detail': 10,
+    'match_mgmt.api_matches': 8,
+    'match_mgmt.api_match_detail': 8,
+    'match_mgmt.api_changes': 8,
+    'match_mgmt.export_match_csv': 6,
+    'match_mgmt.export_match_ics': 6,
+}
+
+# 同一形状的语句执行多少次视为 N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|:\w+)\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class QueryBudgetExceeded(Exception):
+    """严格模式下请求违反查询预算，report 为可读的违规说明"""
+
+    def __init__(self, report):
+        super().__init__(report)
+        self.report = report
+
+
+def statement_shape(statement):
+    """去掉参数值和 IN 列表长度后的语句形状，相同形状视为同一条查询"""
+    shape = ' '.join(statement.split())
+    shape = _IN_LIST.sub('(?…)', shape)
+    return _LITERAL.sub('?', shape)
+
+
+def call_site():
+    """
+    触发本条语句的最内层应用代码位置 (文件:行号)；
+    由模板触发时 (如模板中访问会查询的属性) 再附上模板文件和行号
+    """
+    site = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None and template.filename:
+            lineno = template.get_corresponding_lineno(frame.f_lineno)
+            template_site = f'{os.path.relpath(template.filename, _ROOT)}:{lineno}'
+            return f'{site} ← {template_site}' if site else template_site
+        filename = frame.f_code.co_filename
+        if (site is None and filename.startswith(_ROOT) and filename != __file__
+                and os.sep + 'site-packages' + os.sep not in filename):
+            site = f'{os.path.relpath(filename, _ROOT)}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+    return site or 'unknown'
+
+
+class QueryTracker:
+    """单个请求执行过的语句：{形状: [次数, 第一次的调用位置]}"""
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = {}
+
+    def record(self, statement):
+        self.count += 1
+        shape = statement_shape(statement)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            self.shapes[shape] = [1, call_site()]
+        else:
+            entry[0] += 1
+
+    def repeated(self, threshold):
+        return [(shape, count, site) for shape, (count, site) in self.shapes.items() if count >= threshold]
+
+
+def check_request(endpoint, tracker, budgets=QUERY_BUDGETS, threshold=N_PLUS_ONE_THRESHOLD):
+    """返回违规说明列表，没有违规时为空"""
+    problems = []
+    budget = budgets.get(endpoint)
+    if budget is not None and tracker.count > budget:
+        problems.append(f'{tracker.count} 条 SQL，超出预算 {budget}')
+    for shape, count, site in tracker.repeated(threshold):
+        problems.append(f'疑似 N+1：同一语句执行 {count} 次 @ {site}\n      {shape[:300]}')
+    return problems
+
+
+class QueryBudget:
+    """应用级扩展对象 (app.extensions['query_budget'])，保存最近的违规记录"""
+
+    def __init__(self, strict, threshold):
+        self.strict = strict
+        self.threshold = threshold
+        self.violations = []
+        self.last_count = None  # 最近一个检查完的请求的语句数 (流式响应没有 X-Query-Count 头)
+        self._lock = threading.Lock()
+
+    def add(self, violation):
+        with self._lock:
+            self.violations.append(violation)
+            del self.violations[:-100]
+
+
+def init_query_budget(app, db):
+    """开发/测试环境统计每个请求的 SQL，违反预算或出现 N+1 时记录 (严格模式下抛出异常)"""
+    app.config.setdefault('QUERY_BUDGET_ENABLED', os.environ.get(
+        'QUERY_BUDGET_ENABLED', '0' if os.environ.get('FLASK_ENV') == 'production' else '1') == '1')
+    app.config.setdefault('QUERY_BUDGET_STRICT', os.environ.get('QUERY_BUDGET_STRICT', '0') == '1')
+    app.config.setdefault('N_PLUS_ONE_THRESHOLD', int(os.environ.get('N_PLUS_ONE_THRESHOLD', N_PLUS_ONE_THRESHOLD)))
+
+    if not app.config['QUERY_BUDGET_ENABLED']:
+        return
+
+    budget = QueryBudget(app.config['QUERY_BUDGET_STRICT'], app.config['N_PLUS_ONE_THRESHOLD'])
+    app.extensions['query_budget'] = budget
+
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    def _count_statement(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            tracker = g.get('query_tracker')
+            if tracker is not None:
+                tracker.record(statement)
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _count_statement)
+
+    @app.before_request
+    def _start_query_tracking():
+        g.query_tracker = QueryTracker()
+
+    def _report(endpoint, method, path, tracker):
+        budget.last_count = tracker.count
+        problems = check_request(endpoint, tracker, threshold=budget.threshold)
+        if not problems:
+            return
+        report = f'{method} {path} [{endpoint}]\n' + '\n'.join(f'  - {p}' for p in problems)
+        budget.add({'endpoint': endpoint, 'path': path, 'count': tracker.count,
+                    'problems': problems, 'report': report})
+        if budget.strict:
+            raise QueryBudgetExceeded(report)
+        app.logger.warning('SQL 查询预算：%s', report)
+
+    def _checked_stream(body, endpoint, method, path, tracker):
+        """流式响应 (导出等) 在返回后才继续查询，输出完毕后再检查"""
+        try:
+            yield from body
+        finally:
+            close = getattr(body, 'close', None)
+            if close is not None:
+                close()
+        _report(endpoint, method, path, tracker)
+
+    @app.after_request
+    def _check_query_budget(response):
+        tracker = g.get('query_tracker')
+        if tracker is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        if response.is_streamed:
+            # 生成器在 stream_with_context 中运行时仍记录到同一个 tracker
+            response.response = _checked_stream(response.response, endpoint, request.method,
+                                                request.path, tracker)
+            return response
+
+        g.pop('query_tracker')
+        response.headers['X-Query-Count'] = str(tracker.count)
+        _report(endpoint, request.method, request.path, tracker)
+        return response
+
+
+def _check_endpoints():
+    """CI 入口：在临时数据库上生成少量数据，逐个请求声明了预算的端点"""
+    import tempfile
+
+    workdir = tempfile.mkdtemp(prefix='laopen-query-budget-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'budget.db')
+    os.environ['FLASK_ENV'] = 'production'
+    os.environ['QUERY_BUDGET_ENABLED'] = '1'
+    os.environ['QUERY_BUDGET_STRICT'] = '1'
+    os.environ['LOGIN_LIMITER_ENABLED'] = '0'
+    os.environ.setdefault('METRICS_ENABLED', '0')
+
+    from app import create_app
+    from models import db, init_db, Match
+    from synthetic_data import generate, DEFAULT_PASSWORD
+    # 作为脚本运行时本模块是 __main__，应用注册的是 query_budget 模块中的类
+    from query_budget import QueryBudgetExceeded, QUERY_BUDGETS
+
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    if not init_db(app):
+        return 1
+
+    with app.app_context():
+        generate(users=40, matches=20, rounds=2, courts=2, seed=1, fast=True)
+        finished = db.session.execute(
+            db.select(Match.id).where(Match.status == 'finished').order_by(Match.id)).scalars().first()
+        upcoming = db.session.execute(
+            db.select(Match.id).where(Match.status == 'registering').order_by(Match.id)).scalars().first()
+
+    paths = [
+        ('main.index', '/'),
+        ('tennis.dashboard', '/tennis/dashboard'),
+        ('tennis.api_head_to_head', '/tennis/api/head_to_head/2'),
+        ('tennis.api_top_partners', '/tennis/api/partners'),
+        ('tennis.api_nemesis', '/tennis/api/nemesis'),
+        ('match_mgmt.match_list', '/matches/'),
+        ('match_mgmt.match_detail', f'/matches/{finished}'),
+        ('match_mgmt.match_detail', f'/matches/{upcoming}'),
+        ('match_mgmt.api_matches', '/matches/api/matches'),
+        ('match_mgmt.api_match_detail', f'/matches/api/matches/{finished}'),
+        ('match_mgmt.api_changes', '/matches/api/changes?since=0'),
+        ('match_mgmt.export_match_csv', f'/matches/{finished}/export.csv'),
+        ('match_mgmt.export_match_ics', f'/matches/{finished}/export.ics'),
+    ]
+    unchecked = sorted(set(QUERY_BUDGETS) - {endpoint for endpoint, _ in paths})
+    if unchecked:
+        print(f"⚠️  未覆盖的预算端点：{', '.join(unchecked)}")
+
+    client = app.test_client()
+    # 登录失败时所有 login_required 端点都只会 302 到登录页，检查就没有意义
+    response = client.post('/login', data={'phone': '13000000001', 'password': DEFAULT_PASSWORD})
+    if response.status_code != 302 or '/login' in response.headers.get('Location', ''):
+        print(f"❌ 登录失败 (状态码 {response.status_code})，无法检查端点")
+        return 1
+
+    failures = 0
+    budget = app.extensions['query_budget']
+    for endpoint, path in paths:
+        try:
+            response = client.get(path)
+            # 流式响应在读取完毕时才检查
+            response.get_data()
+            response.close()
+        except QueryBudgetExceeded as e:
+            failures += 1
+            print(f"❌ {e.report}")
+            continue
+        if response.status_code != 200:
+            failures += 1
+            print(f"❌ {path} 返回 {response.status_code}，应为 200")
+        else:
+            count = response.headers.get('X-Query-Count', budget.last_count)
+            print(f"✅ {path} [{endpoint}] {count}/{QUERY_BUDGETS.get(endpoint, '-')} 条 SQL")
+
+    print(f"{'❌' if failures else '🎉'} {len(paths)} 个请求，{failures} 个违规")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(_check_endpoints())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 登录限流
+令牌桶按手机号和客户端IP分别限流，在 bcrypt 校验之前执行，
+脚本暴力尝试 /login 时直接返回 429，不会占满 CPU。
+
+后端:
+- memory: 进程内字典，按 LRU 限制键数量 (单进程/开发环境)
+- sqlite: 本地 SQLite 文件，同一台机器上的多个 worker 共享状态
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from metrics import registry
+
+registry.describe('laopen_login_throttled_total', 'counter', 'Login attempts rejected by the rate limiter')
+
+
+def _refill(tokens, updated_at, now, rate, burst):
+    """按经过的时间补充令牌"""
+    return min(burst, tokens + max(now - updated_at, 0) * rate)
+
+
+class MemoryBackend:
+    """进程内令牌桶，键数量超过上限时淘汰最久未使用的键"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # {key: (tokens, updated_at)}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now=None):
+        """尝试取一个令牌，返回 (是否允许, 需等待秒数)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = _refill(tokens, updated_at, now, rate, burst)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class SQLiteBackend:
+    """基于本地 SQLite 文件的令牌桶，多个 worker 进程共享"""
+
+    # 每多少次调用清理一次早已补满的键
+    PRUNE_EVERY = 500
+
+    def __init__(self, path, max_keys=10000):
+        self.path = path
+        self.max_keys = max_keys
+        self._local = threading.local()
+        self._calls = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS login_buckets ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_login_buckets_updated ON login_buckets (updated_at)')
+
+    def _connection(self):
+        """每个线程一个连接 (fork 后按进程ID重建)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM login_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated_at = row if row else (burst, now)
+            tokens = _refill(tokens, updated_at, now, rate, burst)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                'INSERT INTO login_buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, tokens, now),
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        self._calls += 1
+        if self._calls % self.PRUNE_EVERY == 0:
+            self._prune(conn, now, rate, burst)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, conn, now, rate, burst):
+        """删除已经补满的键，并把键数量控制在上限内"""
+        conn.execute('DELETE FROM login_buckets WHERE updated_at < ?', (now - burst / rate,))
+        conn.execute(
+            'DELETE FROM login_buckets WHERE key IN ('
+            'SELECT key FROM login_buckets ORDER BY updated_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_keys,),
+        )
+
+
+class LoginLimiter:
+    """登录限流器：手机号和IP各一个令牌桶"""
+
+    def __init__(self, backend, phone_rate_per_minute, phone_burst, ip_rate_per_minute, ip_burst):
+        self.backend = backend
+        self.phone_rate = phone_rate_per_minute / 60.0
+        self.phone_burst = phone_burst
+        self.ip_rate = ip_rate_per_minute / 60.0
+        self.ip_burst = ip_burst
+
+    def check(self, phone, ip):
+        """返回 None 表示允许，否则返回建议的 Retry-After 秒数"""
+        allowed, retry_after = self.backend.take(f'ip:{ip}', self.ip_rate, self.ip_burst)
+        if not allowed:
+            registry.inc('laopen_login_throttled_total', scope='ip')
+            return retry_after
+
+        allowed, retry_after = self.backend.take(f'phone:{phone}', self.phone_rate, self.phone_burst)
+        if not allowed:
+            registry.inc('laopen_login_throttled_total', scope='phone')
+            return retry_after
+        return None
+
+
+def client_ip(request, trusted_proxies=0):
+    """获取客户端IP；部署在反向代理之后时取代理追加的 X-Forwarded-For 条目"""
+    if trusted_proxies > 0:
+        route = request.access_route
+        if len(route) >= trusted_proxies:
+            return route[-trusted_proxies]
+    return request.remote_addr or 'unknown'
+
+
+def init_login_limiter(app):
+    """根据配置创建登录限流器"""
+    app.config.setdefault('LOGIN_LIMITER_ENABLED', os.environ.get('LOGIN_LIMITER_ENABLED', '1') == '1')
+    app.config.setdefault('LOGIN_LIMITER_BACKEND', os.environ.get('LOGIN_LIMITER_BACKEND', 'sqlite'))
+    app.config.setdefault('LOGIN_LIMITER_PATH', os.environ.get(
+        'LOGIN_LIMITER_PATH', os.path.join(app.instance_path, 'login_limiter.db')))
+    app.config.setdefault('LOGIN_LIMITER_MAX_KEYS', int(os.environ.get('LOGIN_LIMITER_MAX_KEYS', 10000)))
+    app.config.setdefault('LOGIN_RATE_PER_MINUTE', float(os.environ.get('LOGIN_RATE_PER_MINUTE', 5)))
+    app.config.setdefault('LOGIN_BURST', int(os.environ.get('LOGIN_BURST', 5)))
+    app.config.setdefault('LOGIN_IP_RATE_PER_MINUTE', float(os.environ.get('LOGIN_IP_RATE_PER_MINUTE', 30)))
+    app.config.setdefault('LOGIN_IP_BURST', int(os.environ.get('LOGIN_IP_BURST', 20)))
+    app.config.setdefault('LOGIN_TRUSTED_PROXIES', int(os.environ.get('LOGIN_TRUSTED_PROXIES', 0)))
+
+    if not app.config['LOGIN_LIMITER_ENABLED']:
+        return None
+
+    max_keys = app.config['LOGIN_LIMITER_MAX_KEYS']
+    if app.config['LOGIN_LIMITER_BACKEND'] == 'sqlite':
+        try:
+            backend = SQLiteBackend(app.config['LOGIN_LIMITER_PATH'], max_keys)
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️  登录限流 SQLite 后端不可用，改用进程内存：{e}")
+            backend = MemoryBackend(max_keys)
+    else:
+        backend = MemoryBackend(max_keys)
+
+    limiter = LoginLimiter(backend,
+                           app.config['LOGIN_RATE_PER_MINUTE'], app.config['LOGIN_BURST'],
+                           app.config['LOGIN_IP_RATE_PER_MINUTE'], app.config['LOGIN_IP_BURST'])
+    app.extensions['login_limiter'] = limiter
+    return limiter
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 只读副本路由
+设置 DATABASE_READ_URL 后，GET/HEAD 请求中的查询发到只读副本，其余都走主库：
+
+- 非 GET/HEAD 请求、flush 以及 INSERT/UPDATE/DELETE/原生 SQL 一律走主库
+- 用户写入 (非 GET 请求成功返回，或 GET 请求中发生了 flush) 后的 READ_YOUR_WRITES_SECONDS 秒内，
+  该浏览器的读请求也走主库 (通过 Cookie 标记)，避免刚提交的比分在副本上还看不到
+- 直接使用 db.engine 的代码 (导出、归档、后台线程等) 不受影响，仍然连接主库
+
+未设置 DATABASE_READ_URL 时不注册副本引擎，所有查询照常走主库
+"""
+
+import os
+import time
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, Select
+
+# SQLALCHEMY_BINDS 中副本引擎的名称
+READ_REPLICA_BIND = 'replica'
+
+DEFAULT_READ_YOUR_WRITES_SECONDS = 5
+
+# 写入后标记"读主库"的 Cookie，值为截止时间戳
+STICKY_COOKIE = 'laopen_rw'
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def _read_from_replica():
+    """当前请求的查询能否发到副本"""
+    if not has_request_context() or request.method not in READ_METHODS:
+        return False
+    if g.get('db_primary'):
+        return False
+    try:
+        sticky_until = float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return True
+    return sticky_until < time.time()
+
+
+class RoutingSession(Session):
+    """只读请求中的 SELECT 选择副本引擎，其余沿用 Flask-SQLAlchemy 的绑定规则"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and isinstance(clause, Select)
+                and _read_from_replica()):
+            replica = self._db.engines.get(READ_REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_engine_config(read_url, options):
+    """SQLALCHEMY_BINDS 中副本的配置，连接参数与主库相同"""
+    return dict(options, url=read_url)
+
+
+def init_read_replica(app, db):
+    """在 db.init_app 之后调用：配置了副本时登记写入后的读主库窗口"""
+    app.config.setdefault('READ_YOUR_WRITES_SECONDS', int(os.environ.get(
+        'READ_YOUR_WRITES_SECONDS', DEFAULT_READ_YOUR_WRITES_SECONDS)))
+
+    if not app.config.get('DATABASE_READ_URL'):
+        return
+
+    window = app.config['READ_YOUR_WRITES_SECONDS']
+
+    @event.listens_for(RoutingSession, 'after_flush')
+    def _mark_write(session, flush_context):
+        # GET 请求中发生写入：本请求剩下的查询和之后的窗口都读主库
+        if has_request_context():
+            g.db_primary = True
+            g.db_wrote = True
+
+    @app.after_request
+    def _stick_to_primary(response):
+        wrote = g.pop('db_wrote', False) or request.method not in READ_METHODS + ('OPTIONS',)
+        if wrote and response.status_code < 400 and window > 0:
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + window:.3f}', max_age=window,
+                                httponly=True, samesite='Lax')
+        return response
+
+    print(f"📚 只读副本已启用，写入后 {window}s 内读主库")
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 批量导入球员名单
+新俱乐部入驻时一次导入几百名球员，代替逐个走注册页面：
+- 名单为 CSV (表头 nickname,phone,password[,skill_level]) 或 JSON 数组
+- 昵称/手机号唯一性按批用一条 IN 查询检查，文件内重复也会报出
+- 密码哈希在进程池中并行计算 (spawn 方式启动，不继承 web worker 的线程和连接)
+- 用户分批插入，可选同时加入某个赛事，全部在一个事务中完成
+
+用法: python3 roster_import.py roster.csv [--match 3] [--default-password 123456] [--dry-run]
+管理员也可以通过 POST /admin/roster 上传 (见 auth.py)
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, or_, func
+from models import db, User, Match, match_participants
+from passwords import hash_password_inline, current_rounds
+from versioning import touch_matches
+
+# 与注册表单 (forms.RegistrationForm) 相同的校验规则
+NICKNAME_LENGTH = (2, 20)
+PASSWORD_LENGTH = (6, 20)
+PHONE_PATTERN = re.compile(r'^1[3-9]\d{9}$')
+SKILL_LEVELS = ('beginner', 'intermediate', 'advanced', 'pro')
+
+# 唯一性检查和插入的批大小
+BATCH_SIZE = 500
+
+# 少于该数量的密码直接在当前进程中哈希，不值得启动进程池
+PROCESS_POOL_MIN = 8
+
+
+class RosterError(Exception):
+    """名单无法导入，errors 为逐行的错误信息"""
+
+    def __init__(self, message, errors=None, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.errors = errors or []
+        self.status_code = status_code
+
+
+def parse_roster(content, filename=None):
+    """解析 CSV 或 JSON 名单，返回 [{'nickname', 'phone', 'password', 'skill_level'}, ...]"""
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    stripped = content.lstrip()
+    is_json = (filename or '').lower().endswith('.json') or stripped.startswith(('[', '{'))
+
+    if is_json:
+        try:
+            data = json.loads(stripped)
+        except ValueError as e:
+            raise RosterError(f'Invalid JSON: {e}')
+        if isinstance(data, dict):
+            data = data.get('players', [])
+        if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+            raise RosterError('JSON roster must be a list of player objects')
+        records = data
+    else:
+        records = list(csv.DictReader(io.StringIO(content)))
+
+    players = []
+    for record in records:
+        players.append({
+            'nickname': str(record.get('nickname') or '').strip(),
+            'phone': str(record.get('phone') or '').strip(),
+            'password': str(record.get('password') or ''),
+            'skill_level': str(record.get('skill_level') or 'beginner').strip().lower(),
+        })
+    return players
+
+
+def validate_players(players, default_password=None):
+    """逐行校验格式并检查文件内重复，返回错误列表 (行号从1开始)"""
+    errors = []
+    seen_nicknames, seen_phones = {}, {}
+
+    for row, player in enumerate(players, 1):
+        if not player['password'] and default_password:
+            player['password'] = default_password
+
+        nickname, phone, password = player['nickname'], player['phone'], player['password']
+        if not NICKNAME_LENGTH[0] <= len(nickname) <= NICKNAME_LENGTH[1]:
+            errors.append({'row': row, 'error': 'NickName must be 2-20 characters'})
+        if not PHONE_PATTERN.match(phone):
+            errors.append({'row': row, 'error': 'Invalid phone number'})
+        if not PASSWORD_LENGTH[0] <= len(password) <= PASSWORD_LENGTH[1]:
+            errors.append({'row': row, 'error': 'Password must be 6-20 characters'})
+        if player['skill_level'] not in SKILL_LEVELS:
+            errors.append({'row': row, 'error': f"Unknown skill_level '{player['skill_level']}'"})
+
+        if nickname in seen_nicknames:
+            errors.append({'row': row, 'error': f'Duplicate nickname (same as row {seen_nicknames[nickname]})'})
+        seen_nicknames.setdefault(nickname, row)
+        if phone in seen_phones:
+            errors.append({'row': row, 'error': f'Duplicate phone (same as row {seen_phones[phone]})'})
+        seen_phones.setdefault(phone, row)
+
+    return errors
+
+
+def find_existing(players):
+    """按批查询已被占用的昵称和手机号，返回错误列表"""
+    errors = []
+    for start in range(0, len(players), BATCH_SIZE):
+        batch = players[start:start + BATCH_SIZE]
+        nicknames = [player['nickname'] for player in batch]
+        phones = [player['phone'] for player in batch]
+        rows = db.session.execute(
+            select(User.nickname, User.phone).where(
+                or_(User.nickname.in_(nicknames), User.phone.in_(phones)))
+        ).all()
+        taken_nicknames = {nickname for nickname, _ in rows}
+        taken_phones = {phone for _, phone in rows}
+
+        for offset, player in enumerate(batch):
+            row = start + offset + 1
+            if player['nickname'] in taken_nicknames:
+                errors.append({'row': row, 'error': 'NickName already exists'})
+            if player['phone'] in taken_phones:
+                errors.append({'row': row, 'error': 'Phone number already registered'})
+    return errors
+
+
+def hash_passwords(passwords, rounds=None, workers=None):
+    """并行计算密码哈希，结果顺序与输入一致"""
+    rounds = rounds or current_rounds()
+    if len(passwords) < PROCESS_POOL_MIN:
+        return [hash_password_inline(password, rounds) for password in passwords]
+
+    workers = workers or os.cpu_count() or 2
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(passwords)), mp_context=context) as pool:
+        chunksize = max(len(passwords) // (workers * 4), 1)
+        return list(pool.map(hash_password_inline, passwords, [rounds] * len(passwords),
+                             chunksize=chunksize))
+
+
+def _check_match(match_id, new_count):
+    match = db.session.get(Match, match_id)
+    if match is None:
+        raise RosterError('Match not found', status_code=404)
+    current = db.session.execute(
+        select(func.count()).select_from(match_participants)
+        .where(match_participants.c.match_id == match_id)
+    ).scalar()
+    if current + new_count > match.max_participants:
+        raise RosterError(
+            f'Match has {match.max_participants - current} open spots, roster has {new_count} players',
+            status_code=409)
+    return match, current
+
+
+def import_roster(players, match_id=None, default_password=None, dry_run=False, workers=None):
+    """
+    校验并导入名单，返回 {'created': n, 'match_id': ..., 'dry_run': bool}
+    任何一行有问题时不导入任何人，抛出带逐行错误的 RosterError
+    """
+    if not players:
+        raise RosterError('Roster is empty')
+
+    errors = validate_players(players, default_password) + find_existing(players)
+    if errors:
+        raise RosterError('Roster has errors, nothing was imported', sorted(errors, key=lambda e: e['row']))
+
+    match = None
+    if match_id is not None:
+        match, _ = _check_match(match_id, len(players))
+
+    if dry_run:
+        return {'created': 0, 'valid': len(players), 'match_id': match_id, 'dry_run': True}
+
+    password_hashes = hash_passwords([player['password'] for player in players], workers=workers)
+
+    now = datetime.utcnow()
+    table = User.__table__
+    try:
+        for start in range(0, len(players), BATCH_SIZE):
+            batch = players[start:start + BATCH_SIZE]
+            db.session.execute(table.insert(), [{
+                'nickname': player['nickname'],
+                'phone': player['phone'],
+                'password_hash': password_hash,
+                'skill_level': player['skill_level'],
+                'rating': 1000,
+                'total_wins': 0,
+                'total_losses': 0,
+                'is_admin': False,
+                'created_at': now,
+            } for player, password_hash in zip(batch, password_hashes[start:start + BATCH_SIZE])])
+
+        if match is not None:
+            # 预检之后可能有人单独加入：在写事务中用条件 UPDATE 重新检查容量 (同时锁住赛事行)
+            matches = Match.__table__
+            count = (select(func.count()).select_from(match_participants)
+                     .where(match_participants.c.match_id == match.id).scalar_subquery())
+            fits = db.session.execute(matches.update().where(
+                matches.c.id == match.id, count + len(players) <= matches.c.max_participants,
+            ).values(updated_at=now)).rowcount
+            if not fits:
+                raise RosterError(f'Match no longer has {len(players)} open spots', status_code=409)
+
+            for start in range(0, len(players), BATCH_SIZE):
+                phones = [player['phone'] for player in players[start:start + BATCH_SIZE]]
+                user_ids = db.session.execute(select(User.id).where(User.phone.in_(phones))).scalars()
+                db.session.execute(match_participants.insert(), [
+                    {'match_id': match.id, 'user_id': user_id, 'joined_at': now} for user_id in user_ids
+                ])
+            # 与单人加入一致：报满后转为准备中 (按插入后的实际人数判断)
+            db.session.execute(matches.update().where(
+                matches.c.id == match.id, matches.c.status == 'registering',
+                count >= matches.c.max_participants,
+            ).values(status='preparing'))
+            # 参与者是批量插入的，需手动推进赛事版本号
+            touch_matches(db.session.connection(), [match.id])
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {'created': len(players), 'match_id': match_id, 'dry_run': False}
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description='批量导入球员名单 (CSV/JSON)')
+    parser.add_argument('path', help='名单文件路径')
+    parser.add_argument('--match', type=int, help='同时加入该赛事')
+    parser.add_argument('--default-password', help='名单中没有密码的球员使用的初始密码')
+    parser.add_argument('--dry-run', action='store_true', help='只校验，不导入')
+    parser.add_argument('--workers', type=int, help='哈希进程数 (默认CPU核数)')
+    args = parser.parse_args()
+
+    with open(args.path, 'rb') as f:
+        content = f.read()
+
+    app = create_app()
+    with app.app_context():
+        try:
+            players = parse_roster(content, args.path)
+            print(f"📋 读取到 {len(players)} 名球员，bcrypt 工作因子 {current_rounds()}")
+            started = datetime.utcnow()
+            result = import_roster(players, args.match, args.default_password, args.dry_run, args.workers)
+        except RosterError as e:
+            print(f"❌ {e.message}")
+            for error in e.errors:
+                print(f"  第 {error['row']} 行: {error['error']}")
+            sys.exit(1)
+
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        if result['dry_run']:
+            print(f"✅ 校验通过，共 {result['valid']} 名球员 (未导入)")
+        else:
+            print(f"✅ 已导入 {result['created']} 名球员，耗时 {elapsed:.1f}s")
+            if args.match:
+                print(f"🎾 已全部加入赛事 #{args.match}")
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 比分录入模块
+批量录入比赛结果，并增量更新选手积分和战绩
+"""
+
+from datetime import datetime
+from typing import Dict, List, Tuple
+from sqlalchemy import bindparam, func, or_
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.exc import StaleDataError
+from models import db, User, Game, ArchivedGame
+from pair_stats import PairStatsDelta
+from versioning import bump_counter, RATINGS_COUNTER
+from identity_cache import identity_cache
+
+# ELO 参数
+ELO_K_FACTOR = 32
+
+# 单盘比分上限 (含抢十)
+MAX_SET_SCORE = 99
+
+# 允许通过比分接口写入的比赛状态
+RESULT_STATUSES = ('playing', 'finished')
+
+SET_COLUMNS = (
+    ('set1_team1_score', 'set1_team2_score'),
+    ('set2_team1_score', 'set2_team2_score'),
+    ('set3_team1_score', 'set3_team2_score'),
+)
+
+
+class ScoreEntryError(Exception):
+    """比分录入异常，status_code 对应返回给客户端的HTTP状态码"""
+
+    def __init__(self, message, status_code=400, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details or []
+
+
+def expected_score(team_rating: float, opponent_rating: float) -> float:
+    """ELO期望得分"""
+    return 1.0 / (1.0 + 10 ** ((opponent_rating - team_rating) / 400.0))
+
+
+def elo_delta(team1_rating: float, team2_rating: float, winner_team: int) -> int:
+    """计算队伍1的积分变化 (队伍2为相反数)"""
+    actual = 1.0 if winner_team == 1 else 0.0
+    return int(round(ELO_K_FACTOR * (actual - expected_score(team1_rating, team2_rating))))
+
+
+def parse_result(entry: dict) -> dict:
+    """
+    校验并规范化一条比分提交
+
+    格式: {"game_id": 1, "version": 3, "sets": [[6, 4], [3, 6], [10, 8]],
+           "status": "finished", "winner_team": 1}
+    status 默认 finished，winner_team 省略时根据盘数自动判定
+    """
+    if not isinstance(entry, dict):
+        raise ScoreEntryError('Each result must be an object')
+
+    try:
+        game_id = int(entry['game_id'])
+        version = int(entry['version'])
+    except (KeyError, TypeError, ValueError):
+        raise ScoreEntryError('Each result requires integer game_id and version')
+
+    status = entry.get('status', 'finished')
+    if status not in RESULT_STATUSES:
+        raise ScoreEntryError(f'Game {game_id}: status must be one of {", ".join(RESULT_STATUSES)}')
+
+    sets = entry.get('sets') or []
+    if not isinstance(sets, list) or len(sets) > len(SET_COLUMNS):
+        raise ScoreEntryError(f'Game {game_id}: sets must be a list of at most {len(SET_COLUMNS)} scores')
+
+    scores = []
+    for set_score in sets:
+        try:
+            team1_score, team2_score = (int(value) for value in set_score)
+        except (TypeError, ValueError):
+            raise ScoreEntryError(f'Game {game_id}: each set must be a pair of integers')
+        if not (0 <= team1_score <= MAX_SET_SCORE and 0 <= team2_score <= MAX_SET_SCORE):
+            raise ScoreEntryError(f'Game {game_id}: set scores must be between 0 and {MAX_SET_SCORE}')
+        scores.append((team1_score, team2_score))
+
+    winner_team = entry.get('winner_team')
+    if status == 'finished':
+        team1_sets = sum(1 for a, b in scores if a > b)
+        team2_sets = sum(1 for a, b in scores if b > a)
+        derived = 1 if team1_sets > team2_sets else 2 if team2_sets > team1_sets else 0
+        if winner_team is None:
+            winner_team = derived
+        try:
+            winner_team = int(winner_team)
+        except (TypeError, ValueError):
+            raise ScoreEntryError(f'Game {game_id}: winner_team must be 1 or 2')
+        if winner_team not in (1, 2):
+            raise ScoreEntryError(f'Game {game_id}: a finished game needs a winner (1 or 2)')
+        if derived and derived != winner_team:
+            raise ScoreEntryError(f'Game {game_id}: winner_team does not match the set scores')
+    else:
+        winner_team = 0
+
+    return {
+        'game_id': game_id,
+        'version': version,
+        'status': status,
+        'winner_team': winner_team,
+        'sets': scores,
+    }
+
+
+def can_edit_game(user, game: Game) -> bool:
+    """管理员、赛事创建者以及本场选手可以录入比分"""
+    if user.is_admin or game.match.created_by == user.id:
+        return True
+    team1_ids, team2_ids = game.player_ids
+    return user.id in team1_ids or user.id in team2_ids
+
+
+class _StatsLedger:
+    """
+    汇总一批比赛对选手积分/战绩及两两统计的增量
+    同一选手在一批中出现多次时，按顺序在内存中累加，最后一次性写回
+    """
+
+    def __init__(self, ratings: Dict[int, int]):
+        self.ratings = dict(ratings)
+        self.deltas = {}  # {user_id: {'rating': x, 'wins': x, 'losses': x, 'last_played': dt}}
+        self.pairs = PairStatsDelta()
+        self.recheck_played = set()  # 撤销后不再是已结束的比赛中的选手，需重新计算 last_played
+
+    def _delta(self, user_id):
+        return self.deltas.setdefault(user_id, {'rating': 0, 'wins': 0, 'losses': 0, 'last_played': None})
+
+    def _apply(self, team1_ids, team2_ids, rating_delta, winner_team, sign, played_at=None):
+        for user_id in team1_ids:
+            delta = self._delta(user_id)
+            delta['rating'] += sign * rating_delta
+            self.ratings[user_id] = self.ratings.get(user_id, 0) + sign * rating_delta
+            delta['wins' if winner_team == 1 else 'losses'] += sign
+        for user_id in team2_ids:
+            delta = self._delta(user_id)
+            delta['rating'] -= sign * rating_delta
+            self.ratings[user_id] = self.ratings.get(user_id, 0) - sign * rating_delta
+            delta['wins' if winner_team == 2 else 'losses'] += sign
+        self.pairs.add_game(team1_ids, team2_ids, winner_team, sign)
+        if played_at:
+            for user_id in team1_ids + team2_ids:
+                delta = self._delta(user_id)
+                if delta['last_played'] is None or played_at > delta['last_played']:
+                    delta['last_played'] = played_at
+
+    def team_rating(self, user_ids) -> float:
+        return sum(self.ratings.get(user_id, 0) for user_id in user_ids) / max(len(user_ids), 1)
+
+    def revert(self, game: Game):
+        """撤销一场已结束比赛之前计入的积分和战绩"""
+        team1_ids, team2_ids = game.player_ids
+        self._apply(team1_ids, team2_ids, game.rating_delta or 0, game.winner_team, -1)
+
+    def unfinish(self, game: Game):
+        """已结束的比赛改回未结束：这些选手的最近比赛时间可能就是这一场"""
+        team1_ids, team2_ids = game.player_ids
+        self.recheck_played.update(team1_ids + team2_ids)
+
+    def record(self, game: Game, winner_team: int, played_at: datetime) -> int:
+        """计入一场比赛结果，返回队伍1的积分变化"""
+        team1_ids, team2_ids = game.player_ids
+        rating_delta = elo_delta(self.team_rating(team1_ids), self.team_rating(team2_ids), winner_team)
+        self._apply(team1_ids, team2_ids, rating_delta, winner_team, 1, played_at)
+        return rating_delta
+
+    def flush(self):
+        """以原子自增的方式写回，避免并发录入时丢失其他人的更新"""
+        rows = [
+            {
+                'user_id': user_id,
+                'rating_delta': delta['rating'],
+                'wins_delta': delta['wins'],
+                'losses_delta': delta['losses'],
+            }
+            for user_id, delta in self.deltas.items()
+            if delta['rating'] or delta['wins'] or delta['losses']
+        ]
+        users = User.__table__
+        if rows:
+            db.session.execute(
+                users.update()
+                .where(users.c.id == bindparam('user_id'))
+                .values(
+                    rating=users.c.rating + bindparam('rating_delta'),
+                    total_wins=users.c.total_wins + bindparam('wins_delta'),
+                    total_losses=users.c.total_losses + bindparam('losses_delta'),
+                ),
+                rows,
+            )
+            bump_counter(db.session.connection(), RATINGS_COUNTER)
+
+        played_rows = [
+            {'user_id': user_id, 'played_at': delta['last_played']}
+            for user_id, delta in self.deltas.items()
+            if delta['last_played']
+        ]
+        if played_rows:
+            db.session.execute(
+                users.update()
+                .where(users.c.id == bindparam('user_id'))
+                .where((users.c.last_played.is_(None)) | (users.c.last_played < bindparam('played_at')))
+                .values(last_played=bindparam('played_at')),
+                played_rows,
+            )
+
+        if self.recheck_played:
+            _recompute_last_played(self.recheck_played)
+
+        self.pairs.flush()
+        return sorted({row['user_id'] for row in rows} | self.recheck_played)
+
+
+def _recompute_last_played(user_ids):
+    """按已结束比赛 (含归档表) 重新计算选手的 last_played；比赛需已 flush"""
+    users = User.__table__
+    played_rows = []
+    for user_id in user_ids:
+        latest = None
+        for model in (Game, ArchivedGame):
+            played_at = db.session.execute(
+                db.select(func.max(model.actual_end_time)).where(
+                    model.status == 'finished',
+                    or_(model.player1_id == user_id, model.player2_id == user_id,
+                        model.player3_id == user_id, model.player4_id == user_id))
+            ).scalar()
+            if played_at and (latest is None or played_at > latest):
+                latest = played_at
+        played_rows.append({'user_id': user_id, 'played_at': latest})
+    db.session.execute(
+        users.update().where(users.c.id == bindparam('user_id')).values(last_played=bindparam('played_at')),
+        played_rows,
+    )
+
+
+def record_results(entries: List[dict], editor) -> Tuple[List[Game], List[int]]:
+    """
+    在一个事务中批量录入比赛结果
+
+    Args:
+        entries: 比分提交列表 (格式见 parse_result)
+        editor: 当前提交比分的用户
+
+    Returns:
+        (更新后的Game列表, 积分发生变化的选手ID列表)
+
+    Raises:
+        ScoreEntryError: 参数错误(400)、无权限(403)、比赛不存在(404)或版本冲突(409)
+    """
+    if not isinstance(entries, list) or not entries:
+        raise ScoreEntryError('results must be a non-empty list')
+
+    results = [parse_result(entry) for entry in entries]
+    game_ids = [result['game_id'] for result in results]
+    if len(set(game_ids)) != len(game_ids):
+        raise ScoreEntryError('Each game may only appear once per request')
+
+    games = {
+        game.id: game
+        for game in Game.query.options(joinedload(Game.match)).filter(Game.id.in_(game_ids)).all()
+    }
+    missing = [game_id for game_id in game_ids if game_id not in games]
+    if missing:
+        raise ScoreEntryError('Game not found', 404, [{'game_id': game_id} for game_id in missing])
+
+    forbidden = [game_id for game_id in game_ids if not can_edit_game(editor, games[game_id])]
+    if forbidden:
+        raise ScoreEntryError('You are not allowed to edit these games', 403,
+                              [{'game_id': game_id} for game_id in forbidden])
+
+    # 客户端看到的版本已过期 -> 整批拒绝，返回最新版本让客户端重新确认
+    conflicts = [
+        {'game_id': result['game_id'], 'version': games[result['game_id']].version}
+        for result in results
+        if games[result['game_id']].version != result['version']
+    ]
+    if conflicts:
+        raise ScoreEntryError('Some games were updated by someone else', 409, conflicts)
+
+    player_ids = set()
+    for game in games.values():
+        team1_ids, team2_ids = game.player_ids
+        player_ids.update(team1_ids + team2_ids)
+    ratings = dict(db.session.query(User.id, User.rating).filter(User.id.in_(player_ids)).all())
+    ledger = _StatsLedger(ratings)
+
+    now = datetime.utcnow()
+    updated_games = []
+    for result in results:
+        game = games[result['game_id']]
+
+        # 修改已结束比赛的比分：先撤销之前计入的积分
+        was_finished = game.is_finished and game.winner_team in (1, 2)
+        if was_finished:
+            ledger.revert(game)
+            game.rating_delta = 0
+
+        padded_sets = result['sets'] + [(0, 0)] * (len(SET_COLUMNS) - len(result['sets']))
+        for (team1_column, team2_column), (team1_score, team2_score) in zip(SET_COLUMNS, padded_sets):
+            setattr(game, team1_column, team1_score)
+            setattr(game, team2_column, team2_score)
+
+        game.status = result['status']
+        game.winner_team = result['winner_team']
+        if game.actual_start_time is None:
+            game.actual_start_time = now
+
+        if game.status == 'finished':
+            game.actual_end_time = game.actual_end_time or now
+            game.rating_delta = ledger.record(game, game.winner_team, game.actual_end_time)
+        else:
+            game.actual_end_time = None
+            if was_finished:
+                ledger.unfinish(game)
+
+        updated_games.append(game)
+
+    try:
+        # 带版本号条件的UPDATE：读取之后若有人抢先提交，这里会检测到并回滚
+        db.session.flush()
+        changed_user_ids = ledger.flush()
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        raise ScoreEntryError('Some games were updated by someone else', 409,
+                              [{'game_id': game_id} for game_id in game_ids])
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # 积分/战绩是批量UPDATE写入的，需手动让登录用户缓存失效
+    identity_cache.invalidate(changed_user_ids)
+
+    return updated_games, changed_user_ids
+
+
+def game_result_payload(game: Game) -> dict:
+    """比分接口返回的单场比赛数据"""
+    return {
+        'game_id': game.id,
+        'match_id': game.match_id,
+        'version': game.version,
+        'status': game.status,
+        'winner_team': game.winner_team,
+        'score': game.score_summary,
+        'sets': [[getattr(game, team1_column), getattr(game, team2_column)]
+                 for team1_column, team2_column in SET_COLUMNS],
+    }
@@ -92,9 +92,15 @@ else
 fi
 
 # 启动应用
-echo "⚡ 启动 Flask 应用..."
 echo "🌐 访问地址: http://localhost:5000"
 echo "🛑 按 Ctrl+C 停止服务器"
 echo "=" * 50
 
-python3 app.py
+if [ "$FLASK_ENV" = "production" ]; then
+    # 生产模式：多进程 WSGI 服务器 (gunicorn，不可用时回退到 waitress)
+    echo "⚡ 启动生产服务器..."
+    python3 wsgi.py
+else
+    echo "⚡ 启动 Flask 开发服务器..."
+    python3 app.py
+fi
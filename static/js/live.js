@@ -0,0 +1,123 @@
+// 赛事实时更新：通过 Server-Sent Events 接收比赛状态和比分的增量 (见 live_updates.py)
+
+// 推送连接数已满、连接被拒绝或浏览器不支持 EventSource 时，改为轮询赛事版本号，有变化就刷新整页
+
+// 轮询间隔 (毫秒)，加上随机抖动避免所有手机同时请求
+const POLL_INTERVAL_MS = 15000;
+const POLL_JITTER_MS = 3000;
+
+document.addEventListener('DOMContentLoaded', function() {
+    const container = document.getElementById('live-schedule');
+    if (!container) {
+        return;
+    }
+
+    let pollTimer = null;
+
+    // 赛事详情接口带 ETag，未变化时服务端只返回 304
+    const poll = () => {
+        fetch(container.dataset.pollUrl, {cache: 'no-cache', credentials: 'same-origin'})
+            .then(response => response.ok ? response.json() : null)
+            .then(match => {
+                if (match && match.change_version > Number(container.dataset.version)) {
+                    window.location.reload();
+                }
+            })
+            .catch(() => {});
+    };
+
+    const startPolling = () => {
+        if (pollTimer === null) {
+            pollTimer = setInterval(poll, POLL_INTERVAL_MS + Math.random() * POLL_JITTER_MS);
+            poll();
+        }
+    };
+
+    const stopPolling = () => {
+        clearInterval(pollTimer);
+        pollTimer = null;
+    };
+
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    const titleCase = (text) => text.charAt(0).toUpperCase() + text.slice(1);
+
+    // 按服务端模板 (_schedule.html) 的结构重建比赛状态区域
+    const renderState = (game) => {
+        const fragment = document.createDocumentFragment();
+        if (game.status === 'finished') {
+            const result = document.createElement('div');
+            result.className = 'game-result';
+            const score = document.createElement('span');
+            score.className = 'score';
+            score.textContent = game.score;
+            result.appendChild(score);
+            if (game.winner_team === 1 || game.winner_team === 2) {
+                const badge = document.createElement('span');
+                badge.className = 'winner-badge';
+                badge.textContent = `Team ${game.winner_team} Wins`;
+                result.appendChild(badge);
+            }
+            fragment.appendChild(result);
+        } else {
+            const status = document.createElement('div');
+            status.className = `game-status status-${game.status}`;
+            status.textContent = titleCase(game.status);
+            fragment.appendChild(status);
+        }
+        return fragment;
+    };
+
+    const applyGames = (games) => {
+        games.forEach(game => {
+            const card = container.querySelector(`[data-game-id="${game.id}"]`);
+            if (!card) {
+                return;
+            }
+            const state = card.querySelector('.game-state');
+            if (state && card.dataset.version !== String(game.version)) {
+                state.replaceChildren(renderState(game));
+                card.dataset.version = game.version;
+            }
+            const court = card.querySelector('.game-court');
+            if (court && game.court) {
+                court.textContent = `🏟️ ${game.court}`;
+            }
+        });
+    };
+
+    // 事件ID为赛事版本号，记下已显示到哪个版本
+    const onGames = (event) => {
+        applyGames(JSON.parse(event.data).games);
+        if (event.lastEventId) {
+            container.dataset.version = event.lastEventId;
+        }
+    };
+
+    // 浏览器断线后会自动重连，并带上 Last-Event-ID
+    const source = new EventSource(container.dataset.liveUrl);
+
+    source.addEventListener('open', stopPolling);
+    source.addEventListener('snapshot', onGames);
+    source.addEventListener('games', onGames);
+    // 服务端连接数已满：按 retry 稍后重连，期间轮询
+    source.addEventListener('busy', startPolling);
+    source.addEventListener('error', () => {
+        // 非 200 响应 (如代理报错) 后浏览器不再重连，只能靠轮询
+        if (source.readyState === EventSource.CLOSED) {
+            startPolling();
+        }
+    });
+    source.addEventListener('reload', () => {
+        source.close();
+        window.location.reload();
+    });
+
+    window.addEventListener('pagehide', () => {
+        source.close();
+        stopPolling();
+    });
+});
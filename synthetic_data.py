@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 合成数据生成器 (压测/基准测试用)
+按参数生成任意规模的球员、赛事和比赛，用于暴露数据量增长后的性能问题：
+
+    DATABASE_URL=sqlite:////tmp/bench.db python3 synthetic_data.py \\
+        --users 100000 --matches 25000 --rounds 5 --courts 8 --fast
+
+- 同一个 --seed 生成完全相同的球员、对阵和比分 (日期相对于 --anchor，默认今天)
+- 每名球员有一个隐藏的真实水平，胜负概率按 ELO 期望得分计算，
+  比分的接近程度取决于双方水平差；积分按时间顺序逐场计算，形成真实的积分漂移
+- 全部使用 Core 批量插入，不经过 ORM 和版本号钩子；结束后重建两两统计
+- --fast 时所有球员共用一个预先计算的密码哈希 (登录开销与真实数据相同)，
+  否则在进程池中为每人单独计算哈希 (十万级用户需要数小时)
+
+目标库必须为空；生成的球员密码统一为 --password，管理员为第一个球员
+"""
+
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, bindparam
+from models import db, User, Match, Game, match_participants
+from scoring import expected_score, elo_delta
+from versioning import bump_counter, set_counter, GLOBAL_COUNTER, \
+    RATINGS_COUNTER, CHANGE_LOG_FLOOR_COUNTER
+
+DEFAULT_PASSWORD = 'password123'
+
+# 每次提交的赛事数 (比赛行数约为 赛事数 × 轮数 × 场地数)
+MATCH_BATCH_SIZE = 500
+USER_BATCH_SIZE = 5000
+
+# 双打赛事所占比例；最后多少比例的赛事在未来，处于报名中
+DOUBLES_RATIO = 0.7
+UPCOMING_RATIO = 0.05
+
+# 隐藏水平的分布 (与 ELO 同一量纲)，以及对应的技术等级
+SKILL_MEAN = 1000
+SKILL_STDDEV = 200
+SKILL_LEVELS = ((850, 'beginner'), (1050, 'intermediate'), (1250, 'advanced'), (None, 'pro'))
+
+# 每轮间隔 (与 match_rule 生成的赛程一致) 和单场时长范围 (分钟)
+ROUND_INTERVAL_HOURS = 2
+GAME_MINUTES = (45, 110)
+
+LOCATIONS = ('网球中心', '体育公园', '大学球场', '俱乐部室内馆', '滨江球场', '社区球场')
+
+
+def _skill_level(skill):
+    for upper, level in SKILL_LEVELS:
+        if upper is None or skill < upper:
+            return level
+
+
+def _set_score(rng, team1_wins, closeness):
+    """
+    单盘比分；closeness 为 0~1，双方越接近越容易出现 7-5/7-6
+    返回 (队伍1局数, 队伍2局数)
+    """
+    weights = [
+        (1 - closeness) * 3, (1 - closeness) * 4, 2 + closeness,
+        2 + closeness * 2, 1 + closeness * 3, closeness * 3, closeness * 3,
+    ]
+    loser = rng.choices((0, 1, 2, 3, 4, 5, 6), weights)[0]
+    winner = 6 if loser < 5 else 7
+    return (winner, loser) if team1_wins else (loser, winner)
+
+
+def simulate_sets(rng, team1_win_probability):
+    """三盘两胜，决胜盘为抢十；返回 (获胜队伍, [(局数, 局数), ...])"""
+    closeness = 1 - abs(team1_win_probability - 0.5) * 2
+    sets, won = [], [0, 0]
+    while max(won) < 2:
+        if len(sets) == 2:
+            # 1-1 时打抢十
+            loser = rng.choice((2, 4, 5, 6, 7, 8, 8))
+            winner = max(10, loser + 2)
+            team1_wins = rng.random() < team1_win_probability
+            sets.append((winner, loser) if team1_wins else (loser, winner))
+        else:
+            team1_wins = rng.random() < team1_win_probability
+            sets.append(_set_score(rng, team1_wins, closeness))
+        won[0 if team1_wins else 1] += 1
+    return (1 if won[0] == 2 else 2), sets
+
+
+class _Players:
+    """内存中的球员状态：隐藏水平、当前积分和战绩，按时间顺序逐场更新"""
+
+    def __init__(self, skills, first_id):
+        self.first_id = first_id
+        self.skills = skills
+        self.ratings = [1000] * len(skills)
+        self.wins = [0] * len(skills)
+        self.losses = [0] * len(skills)
+        self.last_played = [None] * len(skills)
+
+    def _team(self, values, user_ids):
+        return sum(values[user_id - self.first_id] for user_id in user_ids) / len(user_ids)
+
+    def play(self, rng, team1_ids, team2_ids, played_at):
+        """模拟一场比赛，返回 (获胜队伍, 比分, 队伍1积分变化)"""
+        probability = expected_score(self._team(self.skills, team1_ids), self._team(self.skills, team2_ids))
+        winner_team, sets = simulate_sets(rng, probability)
+        rating_delta = elo_delta(self._team(self.ratings, team1_ids), self._team(self.ratings, team2_ids),
+                                 winner_team)
+        for user_ids, sign, won in ((team1_ids, 1, winner_team == 1), (team2_ids, -1, winner_team == 2)):
+            for user_id in user_ids:
+                index = user_id - self.first_id
+                self.ratings[index] += sign * rating_delta
+                if won:
+                    self.wins[index] += 1
+                else:
+                    self.losses[index] += 1
+                self.last_played[index] = played_at
+        return winner_team, sets, rating_delta
+
+    def rows(self):
+        for index in range(len(self.skills)):
+            yield {
+                'user_id': self.first_id + index,
+                'rating': self.ratings[index],
+                'total_wins': self.wins[index],
+                'total_losses': self.losses[index],
+                'last_played': self.last_played[index],
+            }
+
+
+def _password_hashes(count, password, fast):
+    from passwords import hash_password_inline
+    if fast:
+        return [hash_password_inline(password)] * count
+    from roster_import import hash_passwords
+    return hash_passwords([password] * count)
+
+
+def _insert_users(conn, rng, count, password_hashes, now):
+    skills = []
+    table = User.__table__
+    for start in range(0, count, USER_BATCH_SIZE):
+        rows = []
+        for index in range(start, min(start + USER_BATCH_SIZE, count)):
+            skill = max(400, min(1800, int(rng.gauss(SKILL_MEAN, SKILL_STDDEV))))
+            skills.append(skill)
+            rows.append({
+                'id': index + 1,
+                'nickname': f'player{index + 1:06d}',
+                'phone': f'13{index + 1:09d}',
+                'password_hash': password_hashes[index],
+                'skill_level': _skill_level(skill),
+                'rating': 1000,
+                'total_wins': 0,
+                'total_losses': 0,
+                'is_admin': index == 0,
+                'created_at': now,
+            })
+        conn.execute(table.insert(), rows)
+    return skills
+
+
+def _match_rows(rng, players, match_id, start, courts, rounds, upcoming, creator_id, now):
+    """生成一个赛事及其参与者和比赛行"""
+    doubles = rng.random() < DOUBLES_RATIO
+    per_court = 4 if doubles else 2
+    capacity = courts * per_court
+    match_type = 'doubles' if doubles else 'singles'
+
+    if upcoming:
+        joined = rng.randint(0, capacity - 1)
+    else:
+        joined = capacity
+    user_ids = [players.first_id + index for index in rng.sample(range(len(players.skills)), joined)]
+    court_names = list(range(1, courts + 1))
+
+    match = {
+        'id': match_id,
+        'name': f'{start:%m.%d} {"双打" if doubles else "单打"}循环赛 #{match_id}',
+        'description': None,
+        'start_datetime': start,
+        'end_datetime': start + timedelta(hours=rounds * ROUND_INTERVAL_HOURS),
+        'location': f'{rng.choice(LOCATIONS)} {courts}片场地',
+        'match_password': f'{match_id:06d}',
+        'max_participants': capacity,
+        'match_type': match_type,
+        'tournament_type': 'round_robin',
+        'court_count': courts,
+        'round_count': rounds,
+        'court_list': json.dumps(court_names),
+        'status': 'registering' if upcoming else 'finished',
+        'registration_deadline': None,
+        'created_by': creator_id,
+        'created_at': min(start - timedelta(days=7), now),
+        'updated_at': now if upcoming else start + timedelta(hours=rounds * ROUND_INTERVAL_HOURS),
+        'change_version': 0,
+    }
+    participants = [{'match_id': match_id, 'user_id': user_id, 'joined_at': match['created_at']}
+                    for user_id in user_ids]
+
+    games = []
+    if not upcoming:
+        for round_number in range(1, rounds + 1):
+            scheduled = start + timedelta(hours=(round_number - 1) * ROUND_INTERVAL_HOURS)
+            order = user_ids[:]
+            rng.shuffle(order)
+            for court_index, court in enumerate(court_names):
+                seats = order[court_index * per_court:(court_index + 1) * per_court]
+                team1_ids, team2_ids = seats[:per_court // 2], seats[per_court // 2:]
+                actual_start = scheduled + timedelta(minutes=rng.randint(0, 15))
+                actual_end = actual_start + timedelta(minutes=rng.randint(*GAME_MINUTES))
+                winner_team, sets, rating_delta = players.play(rng, team1_ids, team2_ids, actual_end)
+                sets = sets + [(0, 0)] * (3 - len(sets))
+                games.append({
+                    'match_id': match_id,
+                    'game_type': match_type,
+                    'round_name': f'Round {round_number}',
+                    'round_number': round_number,
+                    'player1_id': team1_ids[0],
+                    'player2_id': team1_ids[1] if doubles else None,
+                    'player3_id': team2_ids[0],
+                    'player4_id': team2_ids[1] if doubles else None,
+                    'scheduled_time': scheduled,
+                    'actual_start_time': actual_start,
+                    'actual_end_time': actual_end,
+                    'court': f'场地 {court}',
+                    'status': 'finished',
+                    'winner_team': winner_team,
+                    'set1_team1_score': sets[0][0], 'set1_team2_score': sets[0][1],
+                    'set2_team1_score': sets[1][0], 'set2_team2_score': sets[1][1],
+                    'set3_team1_score': sets[2][0], 'set3_team2_score': sets[2][1],
+                    'rating_delta': rating_delta,
+                    'version': 1,
+                    'notes': None,
+                    'created_at': match['created_at'],
+                    'updated_at': actual_end,
+                })
+    return match, participants, games
+
+
+def generate(users, matches, rounds=3, courts=4, seed=1, days=730, anchor=None,
+             password=DEFAULT_PASSWORD, fast=False, progress=None):
+    """
+    生成合成数据，返回 {'users': n, 'matches': n, 'games': n}
+    目标库必须为空
+    """
+    if users < 2:
+        raise ValueError('至少需要 2 名球员')
+    if courts * 4 > users:
+        raise ValueError(f'{courts} 片场地的双打赛事需要至少 {courts * 4} 名球员')
+    if db.session.execute(select(func.count()).select_from(User.__table__)).scalar():
+        raise ValueError('目标数据库已有数据，请使用空数据库')
+    db.session.rollback()
+
+    rng = random.Random(seed)
+    anchor = anchor or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    now = datetime.utcnow()
+    counts = {'users': users, 'matches': matches, 'games': 0}
+
+    password_hashes = _password_hashes(users, password, fast)
+    with db.engine.begin() as conn:
+        skills = _insert_users(conn, rng, users, password_hashes, now)
+    players = _Players(skills, first_id=1)
+    if progress:
+        progress('users', users)
+
+    # 赛事在 [anchor - days, anchor) 内按时间均匀分布，最后一部分放在未来
+    upcoming_from = matches - int(matches * UPCOMING_RATIO)
+    spacing = timedelta(days=days) / max(upcoming_from, 1)
+    first_start = anchor - timedelta(days=days)
+    for batch_start in range(0, matches, MATCH_BATCH_SIZE):
+        match_rows, participant_rows, game_rows = [], [], []
+        for index in range(batch_start, min(batch_start + MATCH_BATCH_SIZE, matches)):
+            upcoming = index >= upcoming_from
+            start = (anchor + timedelta(days=index - upcoming_from + 1) if upcoming
+                     else first_start + spacing * index).replace(minute=0, second=0, microsecond=0)
+            start = start.replace(hour=rng.choice((8, 9, 14, 18)))
+            match, participants, games = _match_rows(
+                rng, players, index + 1, start, courts, rounds, upcoming, creator_id=1, now=now)
+            match_rows.append(match)
+            participant_rows.extend(participants)
+            game_rows.extend(games)
+
+        with db.engine.begin() as conn:
+            conn.execute(Match.__table__.insert(), match_rows)
+            if participant_rows:
+                conn.execute(match_participants.insert(), participant_rows)
+            if game_rows:
+                conn.execute(Game.__table__.insert(), game_rows)
+        counts['games'] += len(game_rows)
+        if progress:
+            progress('matches', min(batch_start + MATCH_BATCH_SIZE, matches))
+
+    # 按时间顺序累计的积分和战绩一次写回
+    users_table = User.__table__
+    update = (users_table.update().where(users_table.c.id == bindparam('user_id'))
+              .values(rating=bindparam('rating'), total_wins=bindparam('total_wins'),
+                      total_losses=bindparam('total_losses'), last_played=bindparam('last_played')))
+    rows = list(players.rows())
+    with db.engine.begin() as conn:
+        for start in range(0, len(rows), USER_BATCH_SIZE):
+            conn.execute(update, rows[start:start + USER_BATCH_SIZE])
+
+    from pair_stats import rebuild_pair_stats
+    rebuild_pair_stats()
+
+    # 数据是绕过版本号钩子写入的：推进版本号让缓存失效，增量同步客户端全量重新同步
+    with db.engine.begin() as conn:
+        version = bump_counter(conn, GLOBAL_COUNTER)
+        bump_counter(conn, RATINGS_COUNTER)
+        set_counter(conn, CHANGE_LOG_FLOOR_COUNTER, version)
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from app import create_app
+    from models import init_db
+
+    parser = argparse.ArgumentParser(description='LaOpen 合成数据生成器')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--matches', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=3, help='每个赛事的轮数')
+    parser.add_argument('--courts', type=int, default=4, help='每个赛事的场地数')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--days', type=int, default=730, help='历史赛事分布的天数')
+    parser.add_argument('--anchor', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                        help='日期基准 YYYY-MM-DD (默认今天)，同一 seed 和 anchor 生成的数据完全相同')
+    parser.add_argument('--password', default=DEFAULT_PASSWORD)
+    parser.add_argument('--fast', action='store_true', help='所有球员共用一个预先计算的密码哈希')
+    args = parser.parse_args()
+
+    def report(name, count):
+        print(f"  … {name}: {count}")
+
+    app = create_app()
+    with app.app_context():
+        if not init_db(app):
+            sys.exit(1)
+        started = time.perf_counter()
+        print(f"🎲 生成 {args.users} 名球员、{args.matches} 个赛事 (seed={args.seed}) ...")
+        try:
+            counts = generate(args.users, args.matches, args.rounds, args.courts, args.seed, args.days,
+                              args.anchor, args.password, args.fast, report)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+        print(f"✅ 球员 {counts['users']}，赛事 {counts['matches']}，比赛 {counts['games']}，"
+              f"耗时 {time.perf_counter() - started:.1f}s")
+        print(f"🔐 管理员: player000001 / 手机 13000000001 / 密码 {args.password}")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 模板缓存
+Jinja 字节码持久化到 instance/jinja_cache，部署或 worker 重启后无需重新编译模板；
+可选在创建应用时预编译全部模板，避免第一个请求承担编译开销
+"""
+
+import os
+import time
+from jinja2 import FileSystemBytecodeCache
+
+
+def init_template_cache(app):
+    """启用字节码缓存，并按配置预热模板"""
+    app.config.setdefault('JINJA_BYTECODE_CACHE_DIR', os.environ.get(
+        'JINJA_BYTECODE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache')))
+    app.config.setdefault('JINJA_WARMUP', os.environ.get('JINJA_WARMUP', '1') == '1')
+
+    cache_dir = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir, '%s.cache')
+        except OSError as e:
+            print(f"⚠️  模板字节码缓存目录不可用：{e}")
+
+    if app.config['JINJA_WARMUP']:
+        warmup_templates(app)
+
+
+def warmup_templates(app):
+    """预编译所有 HTML 模板 (有字节码缓存时只需反序列化)，返回模板数量"""
+    start = time.perf_counter()
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"🧩 模板预热完成：{len(names)} 个模板，耗时 {elapsed:.1f}ms")
+    return len(names)
@@ -4,10 +4,11 @@
 LaOpen 网球管理模块 - 简化版
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime
-from models import db, User, Match, Game
+from sqlalchemy.orm import joinedload
+from models import db, User, Match, Game, ArchivedGame
 
 # 创建网球蓝图
 tennis_bp = Blueprint('tennis', __name__, url_prefix='/tennis')
@@ -17,22 +18,46 @@ tennis_bp = Blueprint('tennis', __name__, url_prefix='/tennis')
 def dashboard():
     """网球Dashboard - 简洁主页"""
     
+    # 模板中会显示对手昵称，选手随比赛一起加载
+    with_players = [joinedload(getattr(Game, f'player{i}')) for i in range(1, 5)]
+    
     # 获取用户的下一场比赛 (从Game表中查找)
-    next_match = Game.query.filter(
+    next_match = Game.query.options(*with_players).filter(
         (Game.player1_id == current_user.id) | (Game.player3_id == current_user.id),
         Game.status == 'scheduled',
         Game.scheduled_time > datetime.utcnow()
     ).order_by(Game.scheduled_time.asc()).first()
     
-    # 获取最近3场比赛记录 (从Game表中查找)
-    recent_matches = Game.query.filter(
-        (Game.player1_id == current_user.id) | (Game.player3_id == current_user.id),
-        Game.status == 'finished'
-    ).order_by(Game.updated_at.desc()).limit(3).all()
+    # 获取最近3场比赛记录 (热表不足3场时从归档表补足)
+    recent_matches = []
+    for model in (Game, ArchivedGame):
+        recent_matches += model.query.options(
+            *[joinedload(getattr(model, f'player{i}')) for i in range(1, 5)]
+        ).filter(
+            (model.player1_id == current_user.id) | (model.player3_id == current_user.id),
+            model.status == 'finished'
+        ).order_by(model.updated_at.desc()).limit(3 - len(recent_matches)).all()
+        if len(recent_matches) >= 3:
+            break
+    
+    # 个人日历订阅地址 (webcal:// 让手机直接添加订阅)
+    from exports import calendar_token
+    calendar_url = url_for('tennis.calendar_feed', token=calendar_token(current_user), _external=True)
     
     return render_template('tennis/dashboard.html', 
                          next_match=next_match,
-                         recent_matches=recent_matches)
+                         recent_matches=recent_matches,
+                         calendar_url=calendar_url)
+
+@tennis_bp.route('/calendar/<token>.ics')
+def calendar_feed(token):
+    """个人日历订阅 - 日历应用无登录态，用签名令牌识别用户"""
+    from exports import user_from_calendar_token, calendar_feed_response
+    
+    user = user_from_calendar_token(token)
+    if user is None:
+        return 'Invalid calendar link', 404
+    return calendar_feed_response(user)
 
 # 简化的功能页面
 @tennis_bp.route('/rankings')
@@ -41,6 +66,38 @@ def rankings():
     """排行榜页面"""
     return "🏆 Rankings Coming Soon!<br><br><a href='/tennis/dashboard'>← Back</a>"
 
+@tennis_bp.route('/api/head_to_head/<int:other_id>')
+@login_required
+def api_head_to_head(other_id):
+    """与指定选手的搭档/交手记录"""
+    from pair_stats import head_to_head
+    
+    other = User.query.get_or_404(other_id)
+    user_id = request.args.get('user_id', current_user.id, type=int)
+    result = head_to_head(user_id, other.id)
+    result['other_nickname'] = other.nickname
+    return jsonify(result)
+
+@tennis_bp.route('/api/partners')
+@login_required
+def api_top_partners():
+    """最常搭档的选手"""
+    from pair_stats import top_partners
+    
+    user_id = request.args.get('user_id', current_user.id, type=int)
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    return jsonify({'user_id': user_id, 'partners': top_partners(user_id, limit)})
+
+@tennis_bp.route('/api/nemesis')
+@login_required
+def api_nemesis():
+    """输得最多的对手 (克星)"""
+    from pair_stats import nemesis_list
+    
+    user_id = request.args.get('user_id', current_user.id, type=int)
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    return jsonify({'user_id': user_id, 'nemesis': nemesis_list(user_id, limit)})
+
 @tennis_bp.route('/matches')
 @login_required
 def matches():
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 变更版本号模块
+每次写入 Match、Game 或赛事参与者时，全局版本号 +1，并把受影响赛事的
+change_version 更新为新版本号。API 基于这些版本号生成 ETag，
+客户端带 If-None-Match 请求时无需查询参与者和比赛表即可返回 304
+
+同一事务中还会把本次变化的实体写入 change_log 表，供增量同步接口使用 (见 delta_sync.py)
+"""
+
+import hashlib
+from datetime import datetime
+from flask import current_app, request
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, attributes
+from models import Match, Game, ChangeCounter, ChangeLog
+
+GLOBAL_COUNTER = 'global'
+
+# 选手积分变化计数器 (积分/排名显示在赛事页的参与者列表中)
+RATINGS_COUNTER = 'ratings'
+
+# change_log 中仍保留的最早版本号 (更早的记录已清理，落后于此的客户端需全量同步)
+CHANGE_LOG_FLOOR_COUNTER = 'change_log_floor'
+
+# change_log 保留最近多少个版本；每隔多少个版本清理一次
+CHANGE_LOG_RETAIN_VERSIONS = 5000
+CHANGE_LOG_PRUNE_EVERY = 100
+
+# flush 期间在 session.info 中暂存本次分配的版本号
+_SESSION_VERSION_KEY = 'laopen_change_version'
+
+
+def bump_counter(connection, name: str = GLOBAL_COUNTER) -> int:
+    """在当前事务中将计数器原子 +1，返回新值"""
+    table = ChangeCounter.__table__
+    result = connection.execute(
+        table.update().where(table.c.name == name).values(value=table.c.value + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(name=name, value=1))
+        return 1
+    return connection.execute(select(table.c.value).where(table.c.name == name)).scalar()
+
+
+def set_counter(connection, name: str, value: int):
+    """在当前事务中把计数器设为指定值"""
+    table = ChangeCounter.__table__
+    result = connection.execute(table.update().where(table.c.name == name).values(value=value))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(name=name, value=value))
+
+
+def read_counter(session, name: str = GLOBAL_COUNTER) -> int:
+    """读取计数器当前值 (单行主键查询)"""
+    table = ChangeCounter.__table__
+    value = session.execute(select(table.c.value).where(table.c.name == name)).scalar()
+    return value or 0
+
+
+def touch_matches(connection, match_ids, entries=None) -> int:
+    """
+    供批量 SQL 写入 (绕过 ORM 的 UPDATE/INSERT) 显式调用：
+    全局版本号 +1，并把这些赛事的 change_version 设为新版本号
+    entries 为 [(entity, entity_id, match_id)] 时只记录这些变化，否则整个赛事重新下发
+    """
+    version = bump_counter(connection)
+    match_ids = list(match_ids)
+    if match_ids:
+        table = Match.__table__
+        connection.execute(
+            table.update().where(table.c.id.in_(match_ids))
+            .values(change_version=version, updated_at=datetime.utcnow())
+        )
+        if entries is None:
+            # 不清楚具体改了哪些行，增量同步时整个赛事重新下发
+            entries = [('match_all', match_id, match_id) for match_id in match_ids]
+        _write_change_log(connection, version, entries)
+    return version
+
+
+def _write_change_log(connection, version, entries):
+    """写入变更日志，并定期清理超出保留范围的旧记录"""
+    if entries:
+        now = datetime.utcnow()
+        connection.execute(ChangeLog.__table__.insert(), [
+            {'version': version, 'entity': entity, 'entity_id': entity_id,
+             'match_id': match_id, 'created_at': now}
+            for entity, entity_id, match_id in sorted(set(entries), key=str)
+        ])
+
+    if version % CHANGE_LOG_PRUNE_EVERY == 0 and version > CHANGE_LOG_RETAIN_VERSIONS:
+        floor = version - CHANGE_LOG_RETAIN_VERSIONS
+        table = ChangeLog.__table__
+        connection.execute(table.delete().where(table.c.version <= floor))
+        set_counter(connection, CHANGE_LOG_FLOOR_COUNTER, floor)
+
+
+def _changed_match_ids(session):
+    """收集本次 flush 中受影响的赛事 (已有ID的赛事ID集合, 新建的赛事对象列表)"""
+    match_ids = set()
+    new_matches = []
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, Match):
+            if obj.id is None:
+                new_matches.append(obj)
+            else:
+                match_ids.add(obj.id)
+        elif isinstance(obj, Game):
+            if obj.match_id is not None:
+                match_ids.add(obj.match_id)
+            elif obj.match is not None:
+                if obj.match.id is None:
+                    new_matches.append(obj.match)
+                else:
+                    match_ids.add(obj.match.id)
+
+    return match_ids, new_matches
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_change_versions(session, flush_context, instances):
+    """flush 前为受影响的赛事分配新的变更版本号"""
+    session.info.pop(_SESSION_VERSION_KEY, None)
+    match_ids, new_matches = _changed_match_ids(session)
+    if not match_ids and not new_matches:
+        return
+
+    connection = session.connection()
+    version = bump_counter(connection)
+    session.info[_SESSION_VERSION_KEY] = version
+
+    for match in new_matches:
+        match.change_version = version
+
+    # 已在会话中的赛事直接改属性，随本次 flush 一起写入；其余用一条 UPDATE
+    detached_ids = []
+    for match_id in match_ids:
+        match = session.identity_map.get(session.identity_key(Match, match_id))
+        if match is not None:
+            match.change_version = version
+        else:
+            detached_ids.append(match_id)
+    if detached_ids:
+        table = Match.__table__
+        connection.execute(
+            table.update().where(table.c.id.in_(detached_ids))
+            .values(change_version=version, updated_at=datetime.utcnow())
+        )
+
+
+def _change_log_entries(session):
+    """flush 后收集变化的实体 (新对象此时已有ID，修改历史尚未重置)"""
+    entries = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, Match):
+            entries.append(('match', obj.id, obj.id))
+            history = attributes.get_history(obj, 'participants')
+            for user in list(history.added) + list(history.deleted):
+                entries.append(('participant', user.id, obj.id))
+        elif isinstance(obj, Game):
+            entries.append(('game', obj.id, obj.match_id))
+    return entries
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_change_log(session, flush_context):
+    """把本次 flush 的变化写入 change_log，与数据修改在同一事务中提交"""
+    version = session.info.pop(_SESSION_VERSION_KEY, None)
+    if version is None:
+        return
+    _write_change_log(session.connection(), version, _change_log_entries(session))
+
+
+def make_etag(*parts) -> str:
+    """由版本号等组成部分生成强 ETag 值"""
+    raw = '|'.join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+
+
+def not_modified_response(etag: str):
+    """请求的 If-None-Match 命中时返回 304 响应，否则返回 None"""
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        return with_etag(response, etag)
+    return None
+
+
+def with_etag(response, etag: str):
+    """为响应设置 ETag，并要求客户端每次重新验证"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaOpen 生产环境入口
+暴露 WSGI 应用对象 `app`，供 gunicorn 等预派生(pre-fork)服务器加载：
+    gunicorn -c gunicorn.conf.py wsgi:app
+无法使用 gunicorn 时 (如 Windows)，直接运行本文件使用纯 Python 的 waitress 服务器：
+    python wsgi.py
+"""
+
+import os
+import sys
+
+from app import create_app, init_directories
+from models import db, init_db
+
+
+def load_app():
+    """创建应用并初始化数据库 (迁移、模板预热、bcrypt 校准都在这里完成)"""
+    init_directories()
+    application = create_app()
+    if not init_db(application):
+        raise RuntimeError('数据库初始化失败，请检查数据库配置')
+    return application
+
+
+# 直接运行本文件时不在这里创建应用：gunicorn 会重新导入 wsgi:app，waitress 在 __main__ 中创建
+if __name__ != '__main__':
+    app = load_app()
+
+
+def reset_after_fork():
+    """
+    在worker进程fork之后调用
+    丢弃从master进程继承来的数据库连接，避免多个进程共用同一个socket/文件句柄
+    """
+    with app.app_context():
+        # 包括只读副本 (DATABASE_READ_URL) 的引擎
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def serve_with_waitress():
+    """纯 Python 的多线程服务器 (单进程)"""
+    from waitress import serve
+
+    app = load_app()
+
+    port = int(os.environ.get('PORT', 5000))
+    threads = int(os.environ.get('WEB_THREADS', 16))
+    print(f"🎉 waitress 启动成功，端口：{port}，线程数：{threads}")
+    serve(app, host='0.0.0.0', port=port, threads=threads,
+          connection_limit=int(os.environ.get('WEB_CONNECTION_LIMIT', 200)),
+          channel_timeout=int(os.environ.get('WEB_TIMEOUT', 60)))
+
+
+def serve_with_gunicorn():
+    """使用 gunicorn.conf.py 的配置启动 gunicorn (应用由 gunicorn 导入 wsgi:app 时创建)"""
+    from gunicorn.app.wsgiapp import run
+
+    sys.argv = ['gunicorn', '-c', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py'),
+                'wsgi:app']
+    run()
+
+
+if __name__ == '__main__':
+    server = os.environ.get('WEB_SERVER', 'auto')
+    if server == 'auto':
+        try:
+            import gunicorn  # noqa: F401
+            server = 'gunicorn' if os.name == 'posix' else 'waitress'
+        except ImportError:
+            server = 'waitress'
+
+    if server == 'gunicorn':
+        serve_with_gunicorn()
+    else:
+        serve_with_waitress()